@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Measures the peak RSS of recording with record_audio_with_vad from a
+# replayed file, for recordings of increasing length. Each run happens in a
+# fresh subprocess so its high-water mark is its own. "list" is the old
+# capture (a bytes object per chunk, joined at the end), "memory" the
+# CaptureBuffer returning the recording, "wav" the CaptureBuffer streaming it
+# to a WAV file.
+#
+#   python -m benchmarks.bench_capture --minutes 1 10 30 --spill_mb 32
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_pipeline import synthetic_speech
+from myspeech_audio import CaptureBuffer, ReplaySource, SAMPLE_RATE, SAMPLE_WIDTH
+from myspeech_lib import record_audio_with_vad
+
+class ListCapture(CaptureBuffer):
+    # The capture as it was: one bytes object per chunk, joined at the end
+    def __init__(self):
+        super().__init__(initial_bytes=0)
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(data)
+        self.size += len(data)
+        return False
+
+    def read(self, start, end=None):
+        return b''.join(self.frames)[start:end]
+
+    def getvalue(self):
+        return b''.join(self.frames)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB elsewhere
+
+def child(mode, path, spill_mb, work_dir):
+    import myspeech_lib
+
+    if mode == "list":
+        myspeech_lib.CaptureBuffer = lambda *args: ListCapture()
+    elif mode == "memory":
+        myspeech_lib.CaptureBuffer = lambda *args: CaptureBuffer(*args, spill_bytes=int(spill_mb * 1024 * 1024))
+    output_file = os.path.join(work_dir, "recording.wav") if mode == "wav" else None
+    start = time.perf_counter()
+    with ReplaySource(path) as source:
+        pcm = record_audio_with_vad(output_file, source=source, silence_duration=24 * 3600)
+    print(json.dumps({"seconds": round(time.perf_counter() - start, 2), "bytes": len(pcm), "peak_rss_mb": round(peak_rss_mb(), 1)}))
+
+def write_recording(path, minutes):
+    # Repeats the synthetic utterance; written in pieces so this process stays small too
+    pcm = synthetic_speech()
+    remaining = int(minutes * 60 * SAMPLE_RATE) * SAMPLE_WIDTH
+    with open(path, "wb") as f:
+        while remaining > 0:
+            f.write(pcm[:remaining])
+            remaining -= len(pcm)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of long replayed recordings")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 30],
+                        help="lengths of the recordings in minutes (default: 1 10 30)")
+    parser.add_argument("--modes", nargs="+", choices=["list", "memory", "wav"], default=["list", "memory", "wav"])
+    parser.add_argument("--spill_mb", type=float, default=32,
+                        help="size above which the in-memory capture moves to a temporary file (default: 32)")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--work_dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.spill_mb, args.work_dir)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="myspeech-bench-capture-")
+    report = {}
+    try:
+        for minutes in args.minutes:
+            path = os.path.join(work_dir, "input.pcm")
+            write_recording(path, minutes)
+            for mode in args.modes:
+                result = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_capture", "--child", mode, path,
+                     "--spill_mb", str(args.spill_mb), "--work_dir", work_dir],
+                    stdout=subprocess.PIPE, check=True, text=True
+                )
+                report.setdefault(f"{minutes:g}_minutes", {})[mode] = json.loads(result.stdout.splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
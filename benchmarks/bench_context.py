@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Times context retrieval for a series of dictations into a few windows:
+# capturing on every dictation versus the cached ContextProvider, plus
+# truncating a long document to the prompt. Captures are simulated with
+# --capture_ms of delay, so it runs anywhere.
+#
+#   python -m benchmarks.bench_context --dictations 50 --windows 3
+import argparse
+import json
+import random
+import time
+
+from myspeech_context import ContextProvider, StaticContextSource
+from myspeech_lib import truncate_prompt, MAX_PROMPT_WORDS
+
+def document(words, seed):
+    rng = random.Random(seed)
+    vocabulary = ["the", "meeting", "notes", "quarterly", "revenue", "is", "up", "and", "costs", "are", "flat"]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+def run(documents, dictations, capture_delay, max_age, seed):
+    source = StaticContextSource(documents, capture_delay)
+    provider = ContextProvider(source, max_age=max_age)
+    rng = random.Random(seed)
+    windows = list(documents)
+    start = time.perf_counter()
+    for i in range(dictations):
+        source.window = rng.choice(windows)
+        window, context = provider.lookup()
+        truncate_prompt(context, MAX_PROMPT_WORDS)
+        provider.append(window, f"dictation number {i}")
+    elapsed = time.perf_counter() - start
+    return {"captures": source.captures, "ms_per_dictation": round(elapsed * 1000 / dictations, 3)}
+
+def time_truncate(text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        truncate_prompt(text, MAX_PROMPT_WORDS)
+    return round((time.perf_counter() - start) * 1e6 / repeat, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare uncached and cached context retrieval")
+    parser.add_argument("--dictations", type=int, default=50, help="number of dictations (default: 50)")
+    parser.add_argument("--windows", type=int, default=3, help="number of windows dictated into (default: 3)")
+    parser.add_argument("--words", type=int, default=20000, help="words in each window's document (default: 20000)")
+    parser.add_argument("--capture_ms", type=float, default=160.0,
+                        help="simulated cost of one capture in milliseconds (default: 160)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = {window: document(args.words, window) for window in range(args.windows)}
+    capture_delay = args.capture_ms / 1000
+    report = {
+        "uncached": run(documents, args.dictations, capture_delay, 0, args.seed),
+        "cached": run(documents, args.dictations, capture_delay, float("inf"), args.seed),
+        "truncate_us": {
+            "document": time_truncate(documents[0], 100),
+            "prompt": time_truncate(truncate_prompt(documents[0], MAX_PROMPT_WORDS), 100),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Compares writing batch results as per-file outputs (save_output, every
+# format) with adding them to a SQLite and a JSON lines corpus, and finding
+# one transcript again: walking the output directory versus a corpus lookup
+# by path and by input hash.
+#
+#   python -m benchmarks.bench_corpus --files 5000 --lookups 200
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from myspeech_cache import hash_bytes, transcription_params
+from myspeech_corpus import open_corpus
+from myspeech_lib import save_output
+
+def fake_transcription(i, segments):
+    words = [f"word{(i + j) % 97}" for j in range(segments * 8)]
+    return {
+        "text": " ".join(words),
+        "segments": [
+            {"id": j, "start": 2.0 * j, "end": 2.0 * j + 1.8, "text": " ".join(words[j * 8:(j + 1) * 8])}
+            for j in range(segments)
+        ],
+    }
+
+def make_inputs(directory, files):
+    # Tiny stand-ins for the audio; the corpus only stats and names them
+    paths, hashes = [], []
+    for i in range(files):
+        path = os.path.join(directory, f"{i // 1000:03d}", f"recording{i}.wav")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = i.to_bytes(4, "little")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+        hashes.append(hash_bytes(data))
+    return paths, hashes
+
+def walk_lookup(output_dir, name):
+    for root, _, files in os.walk(output_dir):
+        if name in files:
+            with open(os.path.join(root, name)) as f:
+                return json.load(f)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-file outputs with a transcript corpus")
+    parser.add_argument("--files", type=int, default=5000, help="number of transcriptions (default: 5000)")
+    parser.add_argument("--segments", type=int, default=20, help="segments per transcription (default: 20)")
+    parser.add_argument("--lookups", type=int, default=200, help="number of lookups (default: 200)")
+    parser.add_argument("--batch_size", type=int, default=500, help="entries per corpus commit (default: 500)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="myspeech-bench-corpus-")
+    report = {}
+    try:
+        paths, hashes = make_inputs(os.path.join(work_dir, "inputs"), args.files)
+        results = [fake_transcription(i, args.segments) for i in range(args.files)]
+        params = transcription_params("distil-whisper-large-v3-en", None, 0, "transcribe", True, None)
+        targets = random.Random(0).sample(range(args.files), min(args.lookups, args.files))
+
+        output_dir = os.path.join(work_dir, "outputs")
+        start = time.perf_counter()
+        for path, result in zip(paths, results):
+            # Outputs are kept in the same layout as the inputs, as an archive would be
+            output_file = os.path.join(output_dir, os.path.relpath(path, os.path.join(work_dir, "inputs")))
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            save_output(result, output_file, "all")
+        write_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in targets:
+            walk_lookup(output_dir, f"recording{i}.json")
+        lookup_seconds = time.perf_counter() - start
+        report["per_file"] = {
+            "files_written": sum(len(files) for _, _, files in os.walk(output_dir)),
+            "write_seconds": round(write_seconds, 3),
+            "lookup_ms": round(lookup_seconds / len(targets) * 1000, 3),
+        }
+
+        for name in ("corpus.sqlite3", "corpus.jsonl"):
+            corpus_path = os.path.join(work_dir, name)
+            start = time.perf_counter()
+            with open_corpus(corpus_path, batch_size=args.batch_size) as corpus:
+                for path, input_hash, result in zip(paths, hashes, results):
+                    corpus.add(path, result, params, input_hash)
+            write_seconds = time.perf_counter() - start
+            with open_corpus(corpus_path) as corpus:
+                start = time.perf_counter()
+                corpus.find(paths[targets[0]])  # Builds the in-memory index of a JSON lines corpus
+                first_lookup = time.perf_counter() - start
+                start = time.perf_counter()
+                for i in targets:
+                    corpus.find(paths[i])
+                path_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                for i in targets:
+                    corpus.find(input_hash=hashes[i])
+                hash_seconds = time.perf_counter() - start
+            report[name.replace(".", "_")] = {
+                "bytes": os.path.getsize(corpus_path),
+                "write_seconds": round(write_seconds, 3),
+                "first_lookup_ms": round(first_lookup * 1000, 3),
+                "path_lookup_ms": round(path_seconds / len(targets) * 1000, 3),
+                "hash_lookup_ms": round(hash_seconds / len(targets) * 1000, 3),
+            }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Load-tests the dictation queue without macOS: a fake event source presses
+# the shortcut for each utterance, recordings and uploads are simulated
+# delays, and the marks and pastes go to a recording keyboard backend. The
+# pipelined queue is compared with one dictation at a time (--max_pending 1,
+# the old behaviour), and the pasted text is checked to be in order.
+#
+#   python -m benchmarks.bench_dictation --utterances 20 --speech 1.0 --upload 0.8
+import argparse
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+from myspeech_dictation import DictationBackend, DictationQueue
+from myspeech_keyboard import MacOSKeyboardController, RecordingKeyboardBackend
+
+class FakeDictationBackend(DictationBackend):
+    def __init__(self, speech, upload, jitter, seed=0):
+        self.speech = speech
+        self.upload = upload
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.keyboard = MacOSKeyboardController(RecordingKeyboardBackend())
+        self.pasted = []
+        self.latencies = []
+        self.idle_event = threading.Event()
+
+    def record(self, dictation):
+        # Ends on trailing silence, or earlier when the shortcut is pressed again
+        dictation.stop_event.wait(self.speech)
+        return f"utterance {dictation.number}"
+
+    def transcribe(self, dictation, pcm):
+        time.sleep(max(0.0, self.upload + self.random.uniform(-self.jitter, self.jitter)))
+        return pcm
+
+    def show(self, old, new):
+        self.keyboard.replace_text(old, new)
+
+    def paste(self, dictation, text):
+        self.keyboard.type_string(text + " ")
+        self.pasted.append(text)
+        self.latencies.append(time.perf_counter() - dictation.speech_ended_at)
+
+    def idle(self):
+        self.idle_event.set()
+
+def run(utterances, max_pending, speech, upload, jitter, gap, seed):
+    backend = FakeDictationBackend(speech, upload, jitter, seed)
+    dictations = DictationQueue(backend, workers=max_pending, max_pending=max_pending)
+    start = time.perf_counter()
+    started = 0
+    while started < utterances:
+        # The user presses the shortcut as soon as the previous utterance ended
+        while dictations.recording:
+            time.sleep(0.001)
+        time.sleep(gap)
+        if dictations.toggle() is None:
+            time.sleep(0.01)  # Ignored: too many dictations in flight
+            continue
+        started += 1
+        time.sleep(0.01)
+    while len(backend.pasted) < utterances:
+        backend.idle_event.wait()
+        backend.idle_event.clear()
+    elapsed = time.perf_counter() - start
+    dictations.close()
+    expected = [f"utterance {i}" for i in range(1, utterances + 1)]
+    latencies = np.array(backend.latencies) * 1000
+    return {
+        "seconds": round(elapsed, 3),
+        "in_order": backend.pasted == expected,
+        "screen_ok": backend.keyboard.backend.typed_text() == "".join(f"{text} " for text in expected),
+        "post_speech_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "post_speech_p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dictation queue with simulated recordings and uploads")
+    parser.add_argument("--utterances", type=int, default=20, help="number of dictations (default: 20)")
+    parser.add_argument("--speech", type=float, default=1.0, help="seconds each recording lasts (default: 1)")
+    parser.add_argument("--upload", type=float, default=0.8, help="seconds each upload takes (default: 0.8)")
+    parser.add_argument("--jitter", type=float, default=0.4, help="random variation of the upload time (default: 0.4)")
+    parser.add_argument("--gap", type=float, default=0.1,
+                        help="seconds between the end of one utterance and the next shortcut press (default: 0.1)")
+    parser.add_argument("--max_pending", type=int, default=4, help="dictations in flight when pipelined (default: 4)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = {
+        "serial": run(args.utterances, 1, args.speech, args.upload, args.jitter, args.gap, args.seed),
+        "pipelined": run(args.utterances, args.max_pending, args.speech, args.upload, args.jitter, args.gap, args.seed),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
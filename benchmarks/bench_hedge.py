@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Compares plain and hedged requests against the fake Groq server with a
+# share of slow responses: latency percentiles, how many requests were sent
+# and how often the hedge won.
+#
+#   python -m benchmarks.bench_hedge --requests 200 --slow_rate 0.05 --slow_latency 2
+import argparse
+import json
+import time
+
+from benchmarks.bench_pipeline import summarize, synthetic_speech
+from benchmarks.fake_groq import FakeGroqServer
+from myspeech_client import TranscriptionClient
+from myspeech_hedge import HedgedTranscriptionClient
+from myspeech_lib import pcm_to_wav
+
+def run(server, client, audio, requests, deadline=None):
+    latencies = []
+    start_requests = server.requests
+    for _ in range(requests):
+        start = time.perf_counter()
+        if deadline is None:
+            client.transcribe(audio, "distil-whisper-large-v3-en")
+        else:
+            client.transcribe(audio, "distil-whisper-large-v3-en", deadline=deadline)
+        latencies.append(time.perf_counter() - start)
+    return {"latency": summarize(latencies), "requests_sent": server.requests - start_requests}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plain and hedged transcription requests")
+    parser.add_argument("--requests", type=int, default=200, help="number of transcriptions (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.1, help="base server latency in seconds (default: 0.1)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="random extra latency in seconds (default: 0.05)")
+    parser.add_argument("--slow_rate", type=float, default=0.05, help="fraction of slow responses (default: 0.05)")
+    parser.add_argument("--slow_latency", type=float, default=2.0, help="extra latency of slow responses (default: 2)")
+    parser.add_argument("--hedge_percentile", type=float, default=90,
+                        help="percentile of past latencies after which to hedge (default: 90)")
+    parser.add_argument("--deadline", type=float, help="also run with this per-request deadline in seconds")
+    args = parser.parse_args()
+
+    audio = pcm_to_wav(synthetic_speech())
+    report = {}
+    with FakeGroqServer(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                        slow_latency=args.slow_latency) as server:
+        with TranscriptionClient("fake-key", base_url=server.base_url) as client:
+            report["plain"] = run(server, client, audio, args.requests)
+        hedged = HedgedTranscriptionClient(TranscriptionClient("fake-key", base_url=server.base_url),
+                                           hedge_percentile=args.hedge_percentile)
+        with hedged:
+            report["hedged"] = run(server, hedged, audio, args.requests)
+            report["hedged"].update(hedges=hedged.hedges, hedge_wins=hedged.hedge_wins,
+                                    hedge_delay_ms=round(hedged.current_hedge_delay() * 1000, 1))
+            if args.deadline:
+                report["deadline"] = run(server, hedged, audio, args.requests, args.deadline)
+                report["deadline"]["deadlines_missed"] = hedged.deadlines_missed
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Counts the keyboard events the service posts for one dictation (typing
+# [REC], turning it into [...], erasing it) and for typing a transcription,
+# per-keystroke versus batched unicode events. Runs anywhere: events go to a
+# recording backend that spends --event_cost_us on each one.
+#
+#   python -m benchmarks.bench_keyboard --event_cost_us 50
+import argparse
+import json
+import time
+
+from myspeech_keyboard import MacOSKeyboardController, RecordingKeyboardBackend
+
+RECORDING_MARK = '[REC]'
+PROCESSING_MARK = '[...]'
+SAMPLE_TEXT = ("Hello Anna, the Q3 numbers are in: revenue is up 12% (see the attached "
+               "report) and costs are flat. Let's meet on Tuesday at 10:30?")
+
+def dictation_marks(controller):
+    controller.type_string(RECORDING_MARK)
+    controller.replace_text(RECORDING_MARK, PROCESSING_MARK)
+    controller.replace_text(PROCESSING_MARK, "")
+
+def dictation_marks_baseline(controller):
+    # What the service did before: erase each mark completely, one
+    # keystroke per character
+    controller.type_string(RECORDING_MARK)
+    controller.backspace(len(RECORDING_MARK))
+    controller.type_string(PROCESSING_MARK)
+    controller.backspace(len(PROCESSING_MARK))
+
+def measure(action, batch, event_cost, shift_delay):
+    backend = RecordingKeyboardBackend(event_cost)
+    controller = MacOSKeyboardController(backend, batch=batch)
+    if shift_delay:
+        # Model the 10 ms pause the service used to take around every shifted key
+        type_with_modifiers = controller.type_with_modifiers
+
+        def delayed(key, modifiers):
+            time.sleep(shift_delay)
+            type_with_modifiers(key, modifiers)
+        controller.type_with_modifiers = delayed
+    start = time.perf_counter()
+    action(controller)
+    elapsed = time.perf_counter() - start
+    return {"events": len(backend.events), "ms": round(elapsed * 1000, 3), "typed": backend.typed_text()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-keystroke and batched typing")
+    parser.add_argument("--event_cost_us", type=float, default=50.0,
+                        help="time spent posting one event, in microseconds (default: 50)")
+    parser.add_argument("--text", default=SAMPLE_TEXT, help="text to type")
+    args = parser.parse_args()
+    event_cost = args.event_cost_us / 1e6
+
+    report = {
+        "marks": {
+            "keystrokes": measure(dictation_marks_baseline, False, event_cost, 0.01),
+            "batched": measure(dictation_marks, True, event_cost, 0),
+        },
+        "text": {
+            "keystrokes": measure(lambda c: c.type_string(args.text), False, event_cost, 0.01),
+            "batched": measure(lambda c: c.type_string(args.text), True, event_cost, 0),
+        },
+    }
+    for results in report.values():
+        for result in results.values():
+            result["correct"] = result.pop("typed") == (args.text if results is report["text"] else "")
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Times each stage of the recognition pipeline against a local fake of the
+# Groq API and prints p50/p95/p99 latencies as JSON.
+#
+#   python -m benchmarks.bench_pipeline --iterations 50 --latency 0.2 -o before.json
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from benchmarks.fake_groq import FakeGroqServer
+from myspeech_audio import ReplaySource, SAMPLE_RATE, SAMPLE_WIDTH
+from myspeech_client import TranscriptionClient
+from myspeech_probe import PREPROCESS_POLICIES
+from myspeech_lib import preprocess_audio, transcribe_audio, save_output, process_audio, record_audio_with_vad, transcribe_pcm
+
+def summarize(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "min_ms": round(float(values.min()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+def synthetic_speech(phrases=3, phrase_length=1.5, pause=0.6, seed=0):
+    # Amplitude-modulated tone bursts separated by near-silence; webrtcvad
+    # classifies the bursts as speech.
+    rng = np.random.default_rng(seed)
+
+    def tone(seconds):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        return np.sin(2 * np.pi * 220 * t) * 8000 * (1 + 0.5 * np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 2000, len(t))
+
+    def silence(seconds):
+        return rng.normal(0, 20, int(seconds * SAMPLE_RATE))
+
+    parts = [silence(0.3)]
+    for _ in range(phrases):
+        parts += [tone(phrase_length), silence(pause)]
+    parts.append(silence(1.5))
+    return np.concatenate(parts).astype(np.int16).tobytes()
+
+def write_wav(path, pcm):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(pcm)
+
+def timed(samples, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="myspeech_bench_")
+    have_ffmpeg = shutil.which("ffmpeg") is not None
+    if args.audio:
+        audio_file = args.audio
+        with wave.open(audio_file, 'rb') as wf:
+            pcm = wf.readframes(wf.getnframes())
+    else:
+        pcm = synthetic_speech(args.phrases)
+        audio_file = os.path.join(work_dir, "speech.wav")
+        write_wav(audio_file, pcm)
+
+    stages = {name: [] for name in ("preprocess", "upload", "save", "process_audio", "replay_capture", "replay_end_to_end")}
+    errors = 0
+    with FakeGroqServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency) as server, \
+            TranscriptionClient("fake-key", base_url=server.base_url, max_retries=args.max_retries) as client:
+        for i in range(args.iterations):
+            try:
+                upload_file = audio_file
+                if have_ffmpeg:
+                    upload_file = timed(stages["preprocess"], preprocess_audio, audio_file,
+                                        os.path.join(work_dir, f"{i}_preprocessed.mp3"), policy=args.preprocess_policy)
+                transcription = timed(stages["upload"], transcribe_audio, upload_file, "fake-key", args.model, client=client)
+                timed(stages["save"], save_output, transcription, os.path.join(work_dir, f"{i}.wav"), "all")
+
+                if have_ffmpeg:
+                    timed(stages["process_audio"], process_audio, audio_file, "fake-key", args.model, None, 0,
+                          "transcribe", False, None, work_dir, "all", client=client)
+
+                start = time.perf_counter()
+                recorded = timed(stages["replay_capture"], record_audio_with_vad,
+                                 source=ReplaySource(pcm, realtime=False), silence_duration=1.0)
+                transcribe_pcm(recorded, "fake-key", args.model, client=client, trim=True)
+                stages["replay_end_to_end"].append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print(f"Iteration {i} failed: {e}", file=sys.stderr)
+        requests_served = server.requests
+        bytes_uploaded = server.bytes_received
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "config": {
+            "iterations": args.iterations,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "slow_rate": args.slow_rate,
+            "slow_latency": args.slow_latency,
+            "preprocess_policy": args.preprocess_policy,
+            "audio_seconds": len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH),
+            "ffmpeg": have_ffmpeg,
+        },
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "requests": requests_served,
+        "bytes_uploaded": bytes_uploaded,
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the speech recognition pipeline against a fake Groq API")
+    parser.add_argument("--iterations", "-n", type=int, default=20)
+    parser.add_argument("--audio", help="16 kHz mono WAV to use instead of synthetic speech")
+    parser.add_argument("--phrases", type=int, default=3, help="number of phrases in the synthetic recording")
+    parser.add_argument("--model", default="distil-whisper-large-v3-en")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake API base latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="fake API extra random latency in seconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="fraction of fake API requests that fail with 503")
+    parser.add_argument("--slow_rate", type=float, default=0.0, help="fraction of fake API requests that are slow")
+    parser.add_argument("--slow_latency", type=float, default=0.0, help="extra latency of slow requests in seconds")
+    parser.add_argument("--max_retries", type=int, default=3)
+    parser.add_argument("--preprocess_policy", choices=PREPROCESS_POLICIES, default="balanced")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    # The pipeline prints progress messages; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
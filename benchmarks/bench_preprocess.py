@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Compares the preprocessing choices for one or more inputs: encode time and
+# upload size of each plan, relative to always transcoding to 32 kbps MP3,
+# and which plan each policy picks. Needs FFmpeg.
+#
+#   python -m benchmarks.bench_preprocess recordings/*.wav -o preprocess.json
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from myspeech_lib import PREPROCESS_ENCODINGS
+from myspeech_probe import probe_audio, choose_preprocessing, PREPROCESS_POLICIES, REMUX_EXTENSIONS, API_EXTENSIONS
+
+def plan_command(input_file, work_dir, plan, info):
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    if plan == "remux":
+        output_file = os.path.join(work_dir, f"{name}.{REMUX_EXTENSIONS[info['codec']]}")
+        options = ['-map', '0:a:0', '-c:a', 'copy']
+    else:
+        extension, codec_options = PREPROCESS_ENCODINGS[plan]
+        output_file = os.path.join(work_dir, f"{name}_{plan}.{extension}")
+        options = ['-ar', '16000', '-ac', '1', '-map', '0:a:'] + codec_options
+    return output_file, ['ffmpeg', '-y', '-loglevel', 'error', '-i', input_file] + options + [output_file]
+
+def measure(input_file, work_dir, plan, info, repeat):
+    if plan == "copy":
+        return {"seconds": 0.0, "bytes": os.path.getsize(input_file)}
+    output_file, command = plan_command(input_file, work_dir, plan, info)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    size = os.path.getsize(output_file)
+    os.remove(output_file)
+    return {"seconds": round(best, 4), "bytes": size}
+
+def bench_file(input_file, work_dir, repeat):
+    info = probe_audio(input_file)
+    plans = list(PREPROCESS_ENCODINGS)
+    if info is not None and info["codec"] in REMUX_EXTENSIONS:
+        plans.insert(0, "remux")
+    if info is not None and info["container"] in API_EXTENSIONS and info["header_ok"] and not info["video"]:
+        plans.insert(0, "copy")
+    results = {plan: measure(input_file, work_dir, plan, info, repeat) for plan in plans}
+    baseline = results["mp3"]
+    for result in results.values():
+        result["seconds_saved"] = round(baseline["seconds"] - result["seconds"], 4)
+        result["bytes_saved"] = baseline["bytes"] - result["bytes"]
+    return {
+        "input": input_file,
+        "probe": info,
+        "plans": results,
+        "policies": {policy: choose_preprocessing(info, policy) for policy in PREPROCESS_POLICIES},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the encode time and upload size of each preprocessing plan")
+    parser.add_argument("audio", nargs="+", help="input file(s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per plan; the fastest counts")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="myspeech_bench_preprocess_")
+    try:
+        report = json.dumps([bench_file(audio, work_dir, args.repeat) for audio in args.audio], indent=2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Spreads a batch of transcriptions over several fake endpoints with
+# different latencies through EndpointRouter, and takes one of them down for
+# part of the run to show ejection and re-admission. Compares throughput with
+# sending everything to the first endpoint alone.
+#
+#   python -m benchmarks.bench_router --requests 300 --jobs 12 --latencies 0.1 0.2 0.4
+import argparse
+import contextlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_pipeline import synthetic_speech
+from benchmarks.fake_groq import FakeGroqServer
+from myspeech_lib import pcm_to_wav
+from myspeech_router import Endpoint, EndpointRouter
+
+def run(client, audio, requests, jobs):
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(client.transcribe, audio, "distil-whisper-large-v3-en") for _ in range(requests)]
+        for future in futures:
+            if future.exception() is not None:
+                failures += 1
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "requests_per_second": round(requests / elapsed, 1), "failures": failures}
+
+def main():
+    parser = argparse.ArgumentParser(description="Route transcriptions over several fake endpoints")
+    parser.add_argument("--requests", type=int, default=300, help="number of transcriptions (default: 300)")
+    parser.add_argument("--jobs", type=int, default=12, help="concurrent transcriptions (default: 12)")
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0.1, 0.2, 0.4],
+                        help="latency of each fake endpoint in seconds (default: 0.1 0.2 0.4)")
+    parser.add_argument("--max_concurrency", type=int, default=4, help="slots per endpoint (default: 4)")
+    parser.add_argument("--outage", type=float, nargs=2, default=[1.0, 3.0], metavar=("START", "END"),
+                        help="seconds into the routed run during which the fastest endpoint fails (default: 1 3)")
+    args = parser.parse_args()
+
+    audio = pcm_to_wav(synthetic_speech())
+    report = {}
+    with contextlib.ExitStack() as stack:
+        servers = [stack.enter_context(FakeGroqServer(latency=latency)) for latency in args.latencies]
+        single = Endpoint("single", servers[0].base_url, "fake-key", max_concurrency=args.max_concurrency)
+        with EndpointRouter([single]) as router:
+            report["single_endpoint"] = run(router, audio, args.requests, args.jobs)
+
+        endpoints = [
+            Endpoint(f"fake{i + 1} ({latency}s)", server.base_url, "fake-key", max_concurrency=args.max_concurrency)
+            for i, (latency, server) in enumerate(zip(args.latencies, servers))
+        ]
+        fastest = servers[args.latencies.index(min(args.latencies))]
+
+        def outage():
+            time.sleep(args.outage[0])
+            fastest.error_rate = 1.0
+            time.sleep(args.outage[1] - args.outage[0])
+            fastest.error_rate = 0.0
+        threading.Thread(target=outage, daemon=True).start()
+
+        with EndpointRouter(endpoints, eject_base=0.5) as router:
+            report["routed"] = run(router, audio, args.requests, args.jobs)
+            report["routed"]["endpoints"] = router.status()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Fails when importing the CLI modules pulls in a heavy dependency or takes
+# longer than the budget. Each module is imported in a fresh interpreter with
+# `python -X importtime`.
+#
+#   python -m benchmarks.check_import_time --budget_ms 150
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that must load without touching the microphone, the VAD or the network
+MODULES = ("myspeech", "myspeech_lib", "myspeech_batch", "myspeech_remote")
+HEAVY_DEPENDENCIES = ("numpy", "pyaudio", "webrtcvad", "requests")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_profile(module):
+    # Returns (cumulative microseconds per top-level import, modules loaded)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # Header line
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+def check(module, budget_ms, repeat):
+    # The fastest of a few runs, so a busy machine doesn't fail the check
+    profiles = [import_profile(module) for _ in range(repeat)]
+    elapsed_ms = min(profile.get(module, 0) for profile in profiles) / 1000
+    loaded = profiles[0]
+    problems = [f"imports {name}" for name in HEAVY_DEPENDENCIES if name in loaded]
+    if elapsed_ms > budget_ms:
+        problems.append(f"took {elapsed_ms:.1f} ms (budget {budget_ms} ms)")
+    return elapsed_ms, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the myspeech CLI modules")
+    parser.add_argument("modules", nargs="*", default=MODULES, help=f"modules to check (default: {' '.join(MODULES)})")
+    parser.add_argument("--budget_ms", type=float, default=150.0, help="maximum cumulative import time per module")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per module; the fastest counts")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        elapsed_ms, problems = check(module, args.budget_ms, args.repeat)
+        if problems:
+            failed = True
+            print(f"FAIL  {module}: {', '.join(problems)}")
+        else:
+            print(f"OK    {module}: {elapsed_ms:.1f} ms")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
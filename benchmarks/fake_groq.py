@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Local stand-in for Groq's /openai/v1/audio/transcriptions endpoint with
+# configurable latency and error injection.
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRANSCRIPTIONS_PATH = "/openai/v1/audio/transcriptions"
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.bytes_received += len(body)
+        if self.path != TRANSCRIPTIONS_PATH:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        latency = server.latency + random.uniform(0, server.jitter)
+        if server.slow_rate and random.random() < server.slow_rate:
+            latency += server.slow_latency
+        time.sleep(latency)
+
+        if server.error_rate and random.random() < server.error_rate:
+            headers = {"Retry-After": str(server.retry_after)} if server.error_status == 429 else None
+            self.send_json(server.error_status, {"error": {"message": "injected error"}}, headers)
+            return
+
+        text = server.text
+        headers = {"openai-processing-ms": str(round(latency * 1000))}
+        if b'name="response_format"\r\n\r\nverbose_json' in body:
+            words = text.split()
+            self.send_json(200, {
+                "text": text,
+                "duration": float(len(words)),
+                "segments": [{"id": 0, "start": 0.0, "end": float(len(words)), "text": text}],
+                "words": [{"word": word, "start": float(i), "end": i + 1.0} for i, word in enumerate(words)],
+            }, headers)
+        else:
+            self.send_json(200, {"text": text}, headers)
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Concurrent benchmark clients connect in bursts
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 retry_after=0, slow_rate=0.0, slow_latency=0.0, text="hello world", verbose=False):
+        super().__init__((host, port), FakeGroqHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.text = text
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/openai/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq transcription endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency in seconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error_status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--retry_after", type=int, default=0, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--slow_rate", type=float, default=0.0, help="fraction of requests that are slow")
+    parser.add_argument("--slow_latency", type=float, default=0.0, help="extra latency of slow requests in seconds")
+    parser.add_argument("--text", default="hello world", help="transcription text to return")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeGroqServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+                            args.retry_after, args.slow_rate, args.slow_latency, args.text, args.verbose)
+    print(f"Fake Groq API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import sys
 import tempfile
-from myspeech_lib import record_audio_with_vad, process_audio  # Updated import
+from myspeech_batch import run_batch, print_batch_summary
+from myspeech_client import TranscriptionClient
+from myspeech_cache import TranscriptionCache, DEFAULT_CACHE_PATH
+from myspeech_manifest import BatchManifest, MANIFEST_NAME
+from myspeech_corpus import open_corpus
+from myspeech_probe import PREPROCESS_POLICIES
+from myspeech_metrics import set_sink, create_sink, METRICS_FORMATS
 
 def main():
+    if sys.argv[1:2] == ["watch"]:
+        from myspeech_watch import main as watch_main
+        return watch_main(sys.argv[2:])
+    if sys.argv[1:2] == ["export"]:
+        from myspeech_corpus import main as export_main
+        return export_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description="Whisper-like CLI using Groq API")
     parser.add_argument("audio", nargs="*", help="audio file(s) to transcribe")
     parser.add_argument("--model", default="distil-whisper-large-v3-en", help="name of the Whisper model to use")
@@ -12,53 +26,161 @@ def main():
     parser.add_argument("--output_dir", "-o", default=".", help="directory to save the outputs")
     parser.add_argument("--temperature", type=float, default=0, help="temperature to use for sampling")
     parser.add_argument("--record", action="store_true", help="record audio from microphone until silence is detected")
+    parser.add_argument("--record_max_duration", type=float,
+                        help="stop --record after this many seconds even if there is no silence")
     parser.add_argument(
         "--output_format", "-f",
         choices=["txt", "vtt", "srt", "tsv", "json", "all"],
-        default="all",
-        help="format of the output file; if not specified, all available formats will be produced (default: all)"
+        help="format of the output file; if not specified, all available formats will be produced, "
+             "or none with --corpus (default: all)"
     )
     parser.add_argument("--task", choices=["transcribe", "translate"], default="transcribe",
                         help="whether to perform transcription or translation")
     parser.add_argument("--word_timestamps", action="store_true",
                         help="extract word-level timestamps (if supported by the model)")
+    parser.add_argument("--max_line_width", type=int,
+                        help="maximum number of characters in a subtitle cue before it is split")
+    parser.add_argument("--word_level", action="store_true",
+                        help="build subtitle cues from word timings instead of segments (requires --word_timestamps)")
     parser.add_argument("--initial_prompt", type=str,
                         help="optional text to provide as a prompt for the first window")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of files to upload concurrently (default: 1)")
+    parser.add_argument("--preprocess_jobs", type=int,
+                        help="number of ffmpeg preprocessing jobs to run concurrently (default: number of CPUs)")
+    parser.add_argument("--preprocess_policy", choices=PREPROCESS_POLICIES, default="balanced",
+                        help="'speed' uploads inputs as they are whenever possible, 'size' always encodes to low-bitrate Opus, "
+                             "'balanced' uploads as is only when no bigger than 16 kHz PCM (default: balanced)")
+    parser.add_argument("--requests_per_minute", type=float,
+                        help="maximum number of API requests to start per minute")
+    parser.add_argument("--connect_timeout", type=float, default=5.0,
+                        help="seconds to wait for a connection to the API (default: 5)")
+    parser.add_argument("--read_timeout", type=float, default=120.0,
+                        help="seconds to wait for the API to respond (default: 120)")
+    parser.add_argument("--endpoints",
+                        help="JSON file listing OpenAI-compatible transcription endpoints to spread requests over "
+                             "(default: the Groq API with GROQ_API_KEY)")
+    parser.add_argument("--max_retries", type=int, default=3,
+                        help="number of times to retry rate-limited or failed requests (default: 3)")
+    parser.add_argument("--chunk_length", type=float,
+                        help="split audio longer than this many seconds at pauses and upload the chunks concurrently")
+    parser.add_argument("--chunk_jobs", type=int, default=4,
+                        help="number of chunks of one file to upload concurrently (default: 4)")
+    parser.add_argument("--chunk_context", action="store_true",
+                        help="prompt each chunk with the end of the previous chunk's text; chunks are then uploaded one at a time")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse transcriptions of unchanged audio from the on-disk cache")
+    parser.add_argument("--refresh_cache", action="store_true",
+                        help="ignore cached transcriptions and overwrite them with fresh results (implies --cache)")
+    parser.add_argument("--prune_cache", action="store_true",
+                        help="evict old or least recently used cache entries; may be used without audio files")
+    parser.add_argument("--cache_path", default=DEFAULT_CACHE_PATH,
+                        help=f"location of the transcription cache (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--cache_max_size", type=float, default=512,
+                        help="maximum size of the cache in MB (default: 512)")
+    parser.add_argument("--cache_max_age", type=float,
+                        help="evict cache entries unused for this many days")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip files that a previous run with the same options already transcribed, and retry the ones that failed")
+    parser.add_argument("--manifest",
+                        help=f"append per-file results to this log, which --resume reads (default with --resume: OUTPUT_DIR/{MANIFEST_NAME})")
+    parser.add_argument("--corpus",
+                        help="add every transcription to this corpus, a SQLite database or a .jsonl file; "
+                             "'myspeech export' writes per-file outputs from it later")
+    parser.add_argument("--metrics",
+                        help="write per-stage timings (preprocessing, upload, server time, saving) to this file")
+    parser.add_argument("--metrics_format", choices=sorted(METRICS_FORMATS), default="jsonl",
+                        help="format of the --metrics file (default: jsonl)")
     parser.add_argument("--verbose", action="store_true",
                         help="print out progress and debug messages")
 
     args = parser.parse_args()
+    if args.output_format is None and not args.corpus:
+        args.output_format = "all"
 
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
 
+    metrics_sink = None
+    if args.metrics:
+        metrics_sink = create_sink(args.metrics, args.metrics_format)
+        set_sink(metrics_sink)
+
+    cache = None
+    if args.cache or args.refresh_cache or args.prune_cache:
+        cache = TranscriptionCache(
+            args.cache_path,
+            max_bytes=int(args.cache_max_size * 1024 * 1024),
+            max_age=args.cache_max_age * 86400 if args.cache_max_age is not None else None,
+            read=not args.refresh_cache
+        )
+
+    if args.prune_cache:
+        removed = cache.prune()
+        print(f"Pruned {removed} entries from {cache.path}")
+        if not args.audio and not args.record:
+            cache.close()
+            return
+        if not args.cache and not args.refresh_cache:
+            cache.close()
+            cache = None
+
     api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
+    if not api_key and not args.endpoints:
         raise ValueError("GROQ_API_KEY environment variable is not set")
 
     if not args.audio and not args.record:
         parser.error("Either audio file(s) or --record must be specified")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.word_level and not args.word_timestamps:
+        parser.error("--word_level requires --word_timestamps")
 
     audio_files = args.audio.copy()
 
     if args.record:
+        # Only recording needs PortAudio and the VAD
+        from myspeech_lib import record_audio_with_vad
+
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            record_audio_with_vad(temp_file.name, args.verbose)
+            record_audio_with_vad(temp_file.name, args.verbose, max_duration=args.record_max_duration)
             audio_files.append(temp_file.name)
 
     if args.verbose:
         print(f"Using model: {args.model}")
         print(f"Output directory: {args.output_dir}")
-        print(f"Output format(s): {args.output_format}")
+        print(f"Output format(s): {args.output_format or 'none'}")
+        if args.corpus:
+            print(f"Corpus: {args.corpus}")
         print(f"Language: {args.language or 'Auto-detect'}")
         print(f"Temperature: {args.temperature}")
         print(f"Task: {args.task}")
         print(f"Word timestamps: {'Enabled' if args.word_timestamps else 'Disabled'}")
         print(f"Initial prompt: {args.initial_prompt or 'None'}")
 
-    for audio_file in audio_files:
-        process_audio(
-            audio_file,
+    # Only kept when asked for: it costs a full hash of every input
+    manifest = None
+    if args.resume or args.manifest:
+        manifest = BatchManifest(args.manifest or os.path.join(args.output_dir, MANIFEST_NAME), resume=args.resume)
+    corpus = open_corpus(args.corpus) if args.corpus else None
+
+    if args.endpoints:
+        from myspeech_router import EndpointRouter, load_endpoints
+
+        endpoints = load_endpoints(args.endpoints, args.connect_timeout, args.read_timeout)
+        client = EndpointRouter(endpoints, max_attempts=max(len(endpoints), args.max_retries + 1))
+    else:
+        client = TranscriptionClient(
+            api_key,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            max_retries=args.max_retries,
+            # Every chunk upload of every file in flight needs its own connection
+            pool_size=args.jobs * (args.chunk_jobs if args.chunk_length else 1)
+        )
+    with client:
+        results = run_batch(
+            audio_files,
             api_key,
             args.model,
             args.language,
@@ -68,12 +190,41 @@ def main():
             args.initial_prompt,
             args.output_dir,
             args.output_format,
-            args.verbose
+            jobs=args.jobs,
+            preprocess_jobs=args.preprocess_jobs,
+            requests_per_minute=args.requests_per_minute,
+            verbose=args.verbose,
+            client=client,
+            cache=cache,
+            chunk_length=args.chunk_length,
+            chunk_jobs=args.chunk_jobs,
+            chunk_context=args.chunk_context,
+            word_level=args.word_level,
+            max_line_width=args.max_line_width,
+            manifest=manifest,
+            preprocess_policy=args.preprocess_policy,
+            corpus=corpus
         )
+        if args.endpoints and args.verbose:
+            for status in client.status():
+                print(f"Endpoint {status['name']}: {status['requests']} requests, "
+                      f"latency {status['latency_ms']} ms, success rate {status['success']}")
+    if manifest is not None:
+        manifest.close()
+    if corpus is not None:
+        corpus.close()
+    if cache is not None:
+        cache.close()
+    if metrics_sink is not None:
+        metrics_sink.close()
+    succeeded = print_batch_summary(results)
 
     if args.record and args.verbose:
         print(f"Removing temporary recorded file: {audio_files[-1]}")
         os.remove(audio_files[-1])
 
+    if not succeeded:
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
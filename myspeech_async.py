@@ -0,0 +1,244 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from myspeech_client import TranscriptionClient, GROQ_API_BASE_URL
+from myspeech_lib import plan_preprocessing, encode_command, pcm_to_wav, preprocessed_file_path, save_output, record_capture_metrics
+from myspeech_audio import CaptureBuffer, PyAudioSource, SpeechEndpointer, trim_silence, SAMPLE_WIDTH
+from myspeech_metrics import span
+
+# asyncio counterparts of the blocking calls in myspeech_lib. Uploads go
+# through httpx (pip install myspeech[async]), ffmpeg runs under
+# asyncio.create_subprocess_exec and capture is an async frame iterator, so
+# any number of queued transcriptions can share one event loop.
+
+class AsyncTranscriptionClient(TranscriptionClient):
+    # Same request format and retry policy as TranscriptionClient. At most
+    # `max_concurrency` requests (default: `pool_size`) are in flight; the
+    # others wait for a slot without holding a thread or a connection.
+    def __init__(self, api_key, base_url=GROQ_API_BASE_URL, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=30.0, pool_size=10, max_concurrency=None):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max, pool_size)
+        self.max_concurrency = max_concurrency or pool_size
+        self.semaphore = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            try:
+                import httpx
+            except ImportError as e:
+                raise ImportError("AsyncTranscriptionClient requires httpx: pip install myspeech[async]") from e
+
+            connect_timeout, read_timeout = self.timeout
+            self._session = httpx.AsyncClient(
+                headers={"Authorization": f"bearer {self.api_key}"},
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+    # The blocking close() and `with` of TranscriptionClient can't shut an
+    # httpx.AsyncClient down
+    def __enter__(self):
+        raise TypeError("AsyncTranscriptionClient is used with 'async with' or closed with 'await client.aclose()'")
+
+    def close(self):
+        raise TypeError("AsyncTranscriptionClient is closed with 'await client.aclose()'")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def post(self, audio, data, verbose=False, filename="audio.wav"):
+        import httpx
+
+        if isinstance(audio, (str, os.PathLike)):
+            filename = os.path.basename(audio)
+            audio = await asyncio.get_running_loop().run_in_executor(None, read_file, audio)
+        elif hasattr(audio, "read"):
+            audio = audio.read()
+        if isinstance(audio, (bytearray, memoryview)):
+            audio = bytes(audio)
+        # Created here so that it belongs to the running loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self.semaphore:
+            attempt = 0
+            while True:
+                try:
+                    with span("upload", attempt=attempt):
+                        response = await self.session.post(self.url, data=data, files={"file": (filename, audio)})
+                except httpx.TransportError as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_delay(attempt)
+                    if verbose:
+                        print(f"Request to Groq API failed ({e}), retrying in {delay:.2f}s")
+                else:
+                    delay = self.check_response(response, attempt, verbose)
+                    if delay is None:
+                        return response
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def transcribe(self, audio, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, filename="audio.wav"):
+        data = self.build_data(model, language, temperature, task, word_timestamps, initial_prompt)
+        if verbose:
+            print("Sending request to Groq API:")
+            print(f"  URL: {self.url}")
+            print(f"  Data: {data}")
+
+        response = await self.post(audio, data, verbose, filename)
+        if verbose:
+            print("Received successful response from Groq API")
+        result = response.json()
+        return result["text"] if not word_timestamps else result
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+async def run_ffmpeg(command, input=None, verbose=False):
+    # Returns ffmpeg's stdout; raises CalledProcessError like subprocess.run(check=True)
+    if verbose:
+        print(f"Running FFmpeg command: {' '.join(command)}")
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE
+    )
+    stdout, _ = await process.communicate(input)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return stdout
+
+async def preprocess_audio_async(input_file, output_file, verbose=False, policy="balanced"):
+    # Returns the file to upload, like preprocess_audio
+    loop = asyncio.get_running_loop()
+    plan, output_file, command = await loop.run_in_executor(None, plan_preprocessing, input_file, output_file, policy, verbose)
+    with span("preprocess", plan=plan) as preprocess_span:
+        if command is not None:
+            await run_ffmpeg(command, verbose=verbose)
+        preprocess_span.set(input_bytes=os.path.getsize(input_file), output_bytes=os.path.getsize(output_file))
+    return output_file
+
+async def encode_pcm_async(pcm, encoding="wav", verbose=False):
+    command = encode_command(encoding)
+    with span("encode", encoding=encoding):
+        if command is None:
+            return pcm_to_wav(pcm), "audio.wav"
+        return await run_ffmpeg(command, bytes(pcm), verbose), f"audio.{encoding}"
+
+async def transcribe_audio_async(file_path, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, client=None, filename="audio.wav"):
+    if client is None:
+        async with AsyncTranscriptionClient(api_key) as client:
+            return await client.transcribe(file_path, model, language, temperature, task, word_timestamps, initial_prompt, verbose, filename)
+    return await client.transcribe(file_path, model, language, temperature, task, word_timestamps, initial_prompt, verbose, filename)
+
+async def transcribe_pcm_async(pcm, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, client=None, encoding="wav", trim=False):
+    if trim:
+        with span("trim"):
+            trimmed = trim_silence(pcm)
+        if not trimmed:
+            return "" if not word_timestamps else {"text": "", "segments": []}
+        pcm = trimmed
+    audio, filename = await encode_pcm_async(pcm, encoding, verbose)
+    return await transcribe_audio_async(audio, api_key, model, language, temperature, task, word_timestamps, initial_prompt, verbose, client, filename)
+
+async def process_audio_async(audio_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, verbose=False, client=None, preprocess_limit=None, word_level=False, max_line_width=None, preprocess_policy="balanced", work_dir=None):
+    # `preprocess_limit` is an optional asyncio.Semaphore bounding how many
+    # ffmpeg processes run at once; uploads are bounded by the client.
+    # Each call preprocesses into a directory of its own (under `work_dir`
+    # if given), so concurrent calls on the same input don't share a file.
+    job_dir = tempfile.mkdtemp(prefix="myspeech_async_", dir=work_dir)
+    preprocessed_file = preprocessed_file_path(audio_file, job_dir)
+    try:
+        if preprocess_limit is None:
+            preprocessed_file = await preprocess_audio_async(audio_file, preprocessed_file, verbose, preprocess_policy)
+        else:
+            async with preprocess_limit:
+                preprocessed_file = await preprocess_audio_async(audio_file, preprocessed_file, verbose, preprocess_policy)
+        transcription = await transcribe_audio_async(preprocessed_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, verbose, client)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    # save_output replaces the extension itself, as in save_transcription
+    output_file = os.path.join(output_dir, os.path.basename(audio_file))
+    loop = asyncio.get_running_loop()
+    with span("save"):
+        await loop.run_in_executor(None, save_output, transcription, output_file, output_format, verbose, word_level, max_line_width)
+    return output_file
+
+async def iter_frames(source, chunk=480):
+    # Yields `chunk`-sample frames from an AudioSource. One thread does the
+    # blocking reads and hands the frames to the event loop.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def capture():
+        try:
+            while not stopped.is_set():
+                data = source.read(chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, data)
+                if len(data) < chunk * SAMPLE_WIDTH:
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+    try:
+        while True:
+            data = await queue.get()
+            if isinstance(data, Exception):
+                raise data
+            if len(data) < chunk * SAMPLE_WIDTH:
+                return  # End of a replayed recording
+            yield data
+    finally:
+        # The source must not be stopped while the reader is still inside read()
+        stopped.set()
+        await loop.run_in_executor(None, thread.join)
+
+async def record_audio_with_vad_async(verbose=False, silence_duration=2.0, stop_event=None, source=None, on_segment=None, segment_silence=0.3, max_duration=None, max_bytes=None):
+    # Like record_audio_with_vad; `stop_event` is an asyncio.Event that ends
+    # the recording early.
+    loop = asyncio.get_running_loop()
+    capture = CaptureBuffer(max_duration=max_duration, max_bytes=max_bytes)
+    endpointer = SpeechEndpointer(silence_duration, on_segment, segment_silence, capture=capture)
+    owns_source = source is None
+    if owns_source:
+        source = await loop.run_in_executor(None, PyAudioSource, 480, False)
+    await loop.run_in_executor(None, source.start)
+    started_at = time.perf_counter()
+    if verbose:
+        print("Recording... (Speak now, recording will stop after prolonged silence)")
+
+    frames = iter_frames(source)
+    try:
+        async for data in frames:
+            if endpointer.feed(data) or (stop_event is not None and stop_event.is_set()):
+                break
+    finally:
+        await frames.aclose()
+
+    record_capture_metrics(started_at, endpointer)
+    pcm = endpointer.finish()
+    await loop.run_in_executor(None, source.stop)
+    if owns_source:
+        await loop.run_in_executor(None, source.close)
+    return pcm
@@ -0,0 +1,415 @@
+import mmap
+import os
+import tempfile
+import threading
+import time
+import wave
+
+# numpy, pyaudio and webrtcvad are imported where they are used, so that
+# transcribing files starts quickly and works without PortAudio installed.
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit PCM
+CHANNELS = 1
+VAD_FRAME_MS = 30
+VAD_FRAME_SAMPLES = SAMPLE_RATE * VAD_FRAME_MS // 1000
+VAD_FRAME_BYTES = VAD_FRAME_SAMPLES * SAMPLE_WIDTH
+ENERGY_FLOOR = 100  # RMS (int16 units) below which a frame is never speech
+
+def pcm_frames(pcm):
+    # Zero-copy (frames x samples) view over whole 30 ms frames of the PCM
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    count = len(samples) // VAD_FRAME_SAMPLES
+    return samples[:count * VAD_FRAME_SAMPLES].reshape(count, VAD_FRAME_SAMPLES)
+
+def frame_rms(frames):
+    import numpy as np
+
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=-1))
+
+def speech_mask(pcm, vad_mode=3, energy_floor=ENERGY_FLOOR):
+    # Energy-gate every frame at once, then ask webrtcvad only about the loud ones
+    import numpy as np
+    import webrtcvad
+
+    mask = frame_rms(pcm_frames(pcm)) >= energy_floor
+    vad = webrtcvad.Vad(vad_mode)
+    view = memoryview(pcm)
+    for i in np.flatnonzero(mask):
+        mask[i] = vad.is_speech(view[i * VAD_FRAME_BYTES:(i + 1) * VAD_FRAME_BYTES], SAMPLE_RATE)
+    return mask
+
+def trim_silence(pcm, padding=0.25, vad_mode=3, energy_floor=ENERGY_FLOOR):
+    # Drop every frame further than `padding` seconds from speech: leading and
+    # trailing silence disappears and long pauses shrink to 2 * padding.
+    # Returns b'' when there is no speech at all.
+    import numpy as np
+
+    frames = pcm_frames(pcm)
+    if not len(frames):
+        return b''
+    mask = speech_mask(pcm, vad_mode, energy_floor)
+    pad = int(padding * 1000 / VAD_FRAME_MS)
+    # Full convolution, cut back to the mask's own length: mode='same' is as
+    # long as the kernel when the recording is shorter than it
+    keep = np.convolve(mask.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32))[pad:pad + len(mask)] > 0
+    return frames[keep].tobytes()
+
+class CaptureBuffer:
+    # Holds a recording while it is captured, without a bytes object per
+    # chunk. PCM is appended to a preallocated bytearray that doubles when
+    # full, and moves to an anonymous temporary file once it would outgrow
+    # `spill_bytes`, so memory stays bounded however long the recording runs.
+    # With `wav_file`, it is streamed to that WAV instead as it arrives.
+    # Capture ends after `max_duration` seconds or `max_bytes` bytes.
+    def __init__(self, wav_file=None, max_duration=None, max_bytes=None, spill_bytes=32 * 1024 * 1024,
+                 initial_bytes=60 * SAMPLE_RATE * SAMPLE_WIDTH):
+        limits = [limit for limit in (max_bytes, None if max_duration is None else int(max_duration * SAMPLE_RATE) * SAMPLE_WIDTH)
+                  if limit is not None]
+        self.limit = min(limits) // SAMPLE_WIDTH * SAMPLE_WIDTH if limits else None
+        self.spill_bytes = spill_bytes
+        self.size = 0
+        self.buffer = None
+        self.file = None
+        self.wav = None
+        self.data_offset = 0
+        if wav_file:
+            self.file = open(wav_file, 'w+b')
+            self.wav = wave.open(self.file, 'wb')
+            self.wav.setnchannels(CHANNELS)
+            self.wav.setsampwidth(SAMPLE_WIDTH)
+            self.wav.setframerate(SAMPLE_RATE)
+            self.wav.writeframesraw(b'')  # Header; its sizes are patched on close
+            self.data_offset = self.file.tell()
+        else:
+            self.buffer = bytearray(min(initial_bytes, spill_bytes))
+
+    @property
+    def full(self):
+        return self.limit is not None and self.size >= self.limit
+
+    def write(self, data):
+        # Returns True once the limit is reached; audio past it is dropped
+        if self.limit is not None:
+            data = memoryview(data)[:self.limit - self.size]
+        end = self.size + len(data)
+        if self.wav is not None:
+            self.wav.writeframesraw(data)
+        elif self.file is not None:
+            self.file.write(data)
+        elif end > self.spill_bytes:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(memoryview(self.buffer)[:self.size])
+            self.file.write(data)
+            self.buffer = None
+        else:
+            if end > len(self.buffer):
+                self.buffer.extend(bytes(min(self.spill_bytes, max(end, 2 * len(self.buffer))) - len(self.buffer)))
+            self.buffer[self.size:end] = data
+        self.size = end
+        return self.full
+
+    def read(self, start, end=None):
+        # Bytes `start` to `end` of the recording so far
+        end = self.size if end is None else min(end, self.size)
+        if self.buffer is not None:
+            with memoryview(self.buffer) as view:
+                return view[start:end].tobytes()
+        self.file.flush()
+        return os.pread(self.file.fileno(), max(0, end - start), self.data_offset + start)
+
+    def getvalue(self):
+        # Ends the capture and returns the whole recording without copying
+        # it: a view of the buffer, or of the file mapped into memory, which
+        # the OS pages in as it is read.
+        if self.buffer is not None:
+            return memoryview(self.buffer)[:self.size]
+        if self.file is None:
+            return b''
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+        self.file.flush()
+        if self.size:
+            mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            pcm = memoryview(mapping)[self.data_offset:self.data_offset + self.size]
+        else:
+            pcm = b''
+        self.close()
+        return pcm
+
+    def close(self):
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class SpeechEndpointer:
+    # Decides, one 30 ms frame at a time, when a recording is over: after
+    # `silence_duration` seconds of silence following some speech. With
+    # `on_segment`, every stretch of speech followed by `segment_silence`
+    # seconds of silence is handed over as soon as it is final. The audio
+    # goes to `capture`, a CaptureBuffer, whose limits also end the recording.
+    def __init__(self, silence_duration=2.0, on_segment=None, segment_silence=0.3, vad_mode=3, energy_floor=ENERGY_FLOOR, capture=None):
+        import webrtcvad
+
+        self.vad = webrtcvad.Vad(vad_mode)
+        self.energy_floor = energy_floor
+        self.on_segment = on_segment
+        self.silence_frames = int(silence_duration * 1000 / VAD_FRAME_MS)
+        self.segment_frames = max(1, int(segment_silence * 1000 / VAD_FRAME_MS))
+        self.capture = capture if capture is not None else CaptureBuffer()
+        self.silent_frames = 0
+        self.voiced_frames = 0
+        self.segment_start = 0
+        self.segment_voiced = False
+        self.last_speech_at = None
+
+    def feed(self, data):
+        # Returns True once the recording should stop
+        import numpy as np
+
+        # Frames too quiet to be speech never reach webrtcvad
+        is_speech = frame_rms(np.frombuffer(data, dtype=np.int16)) >= self.energy_floor and self.vad.is_speech(data, SAMPLE_RATE)
+        full = self.capture.write(data)
+        if is_speech:
+            self.silent_frames = 0
+            self.voiced_frames += 1
+            self.segment_voiced = True
+            self.last_speech_at = time.perf_counter()
+        else:
+            self.silent_frames += 1
+
+        if self.on_segment and self.segment_voiced and self.silent_frames == self.segment_frames:
+            self.flush_segment()
+
+        return full or (self.voiced_frames > 0 and self.silent_frames > self.silence_frames)
+
+    def flush_segment(self):
+        self.on_segment(self.capture.read(self.segment_start))
+        self.segment_start = self.capture.size
+        self.segment_voiced = False
+
+    def finish(self):
+        # Hands over the last segment and returns the whole recording
+        if self.on_segment and self.segment_voiced:
+            self.flush_segment()
+        return self.capture.getvalue()
+
+class AudioSource:
+    # Delivers 16 kHz mono 16-bit PCM. read() returns fewer bytes than
+    # requested only once the input is exhausted.
+    def mark(self):
+        # Called as soon as a recording is requested, before start()
+        pass
+
+    def start(self):
+        pass
+
+    def read(self, num_frames):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class PyAudioSource(AudioSource):
+    # With keep_warm, the device stream stays open between recordings so a
+    # hotkey press doesn't pay the device-open latency or clip the first words.
+    def __init__(self, chunk=480, keep_warm=True, device_index=None):
+        import pyaudio
+
+        self.chunk = chunk
+        self.keep_warm = keep_warm
+        self.device_index = device_index
+        self.audio = pyaudio.PyAudio()
+        self.stream = None
+
+    def open_stream(self):
+        import pyaudio
+
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=CHANNELS,
+            rate=SAMPLE_RATE,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk
+        )
+
+    def start(self):
+        if self.stream is None:
+            self.open_stream()
+            return
+        # Drop audio captured since the previous recording
+        available = self.stream.get_read_available()
+        if available:
+            self.stream.read(available, exception_on_overflow=False)
+
+    def read(self, num_frames):
+        return self.stream.read(num_frames, exception_on_overflow=False)
+
+    def stop(self):
+        if not self.keep_warm:
+            self.close_stream()
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        self.close_stream()
+        self.audio.terminate()
+
+class ReplaySource(AudioSource):
+    # Replays a WAV file, a raw 16 kHz mono s16le file or PCM bytes. With
+    # realtime, reads are paced like a live microphone; otherwise they return
+    # immediately, which makes the capture loop deterministic and benchmarkable.
+    # Files are read as they are replayed, not loaded up front.
+    def __init__(self, audio, realtime=False):
+        self.pcm = None
+        self.wav = None
+        self.file = None
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            self.pcm = bytes(audio)
+        elif str(audio).lower().endswith(".wav"):
+            self.wav = wave.open(str(audio), 'rb')
+            if (self.wav.getframerate(), self.wav.getnchannels(), self.wav.getsampwidth()) != (SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH):
+                self.wav.close()
+                raise ValueError(f"{audio} must be 16 kHz mono 16-bit PCM")
+        else:
+            self.file = open(audio, "rb")
+        self.realtime = realtime
+        self.position = 0
+        self.started_at = None
+        self.started_position = 0
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.started_position = self.position
+
+    def read(self, num_frames):
+        if self.started_at is None:
+            self.start()
+        if self.wav is not None:
+            data = self.wav.readframes(num_frames)
+        elif self.file is not None:
+            data = self.file.read(num_frames * SAMPLE_WIDTH)
+        else:
+            data = self.pcm[self.position:self.position + num_frames * SAMPLE_WIDTH]
+        self.position += len(data)
+        if self.realtime:
+            elapsed = (self.position - self.started_position) / (SAMPLE_RATE * SAMPLE_WIDTH)
+            delay = self.started_at + elapsed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+    def close(self):
+        if self.wav is not None:
+            self.wav.close()
+        if self.file is not None:
+            self.file.close()
+
+class RingBuffer:
+    # Fixed-size, preallocated ring of int16 samples. Positions are absolute
+    # sample counts since capture began; only the last `capacity` are retained.
+    def __init__(self, capacity):
+        import numpy as np
+
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=np.int16)
+        self.written = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, data):
+        import numpy as np
+
+        samples = np.frombuffer(data, dtype=np.int16)
+        skipped = max(0, len(samples) - self.capacity)
+        samples = samples[skipped:]
+        with self.condition:
+            self.written += skipped
+            start = self.written % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self.samples[start:start + first] = samples[:first]
+            self.samples[:len(samples) - first] = samples[first:]
+            self.written += len(samples)
+            self.condition.notify_all()
+
+    def read(self, position, count, timeout=None):
+        # Waits until `count` samples from `position` are captured (or the ring is
+        # closed) and returns them as bytes with the position after them.
+        with self.condition:
+            self.condition.wait_for(lambda: self.written >= position + count or self.closed, timeout)
+            position = max(position, self.written - self.capacity)
+            count = min(count, self.written - position)
+            start = position % self.capacity
+            first = min(count, self.capacity - start)
+            data = self.samples[start:start + first].tobytes()
+            if first < count:
+                data += self.samples[:count - first].tobytes()
+        return data, position + count
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class RingBufferSource(AudioSource):
+    # Captures continuously from `source` on a background thread. Each
+    # recording starts `preroll` seconds before it was requested, so words
+    # spoken while the service sets up are not lost.
+    def __init__(self, source, preroll=0.3, capacity=10.0, chunk=480):
+        self.source = source
+        self.chunk = chunk
+        self.preroll = int(preroll * SAMPLE_RATE)
+        self.ring = RingBuffer(int((preroll + capacity) * SAMPLE_RATE))
+        self.position = 0
+        self.marked = None
+        self.running = True
+        self.thread = threading.Thread(target=self.capture, daemon=True)
+        self.thread.start()
+
+    def capture(self):
+        self.source.start()
+        while self.running:
+            data = self.source.read(self.chunk)
+            if data:
+                self.ring.write(data)
+            if len(data) < self.chunk * SAMPLE_WIDTH:
+                break
+        self.ring.close()
+
+    def mark(self):
+        self.marked = max(0, self.ring.written - self.preroll)
+
+    def start(self):
+        if self.marked is None:
+            self.mark()
+        self.position = self.marked
+        self.marked = None
+
+    def read(self, num_frames):
+        data, self.position = self.ring.read(self.position, num_frames)
+        return data
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        self.source.close()
@@ -0,0 +1,246 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from myspeech_lib import preprocess_audio, transcribe_file, cached_source_transcription, save_transcription, output_paths
+from myspeech_cache import hash_file, transcription_params
+
+class RateLimiter:
+    # Spaces requests evenly so that at most `requests_per_minute` start in any minute.
+    def __init__(self, requests_per_minute=None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+def _prepare(audio_file, preprocessed_file, cache, model, language, temperature, task, word_timestamps, initial_prompt, verbose, hash_input=False, preprocess_policy="balanced"):
+    # Returns (input hash or None, source_key, cached transcription or None, file
+    # to upload); only preprocesses on a cache miss
+    input_hash, source_key, transcription = None, None, None
+    if hash_input:
+        input_hash = hash_file(audio_file)
+    if cache is not None:
+        source_key, transcription = cached_source_transcription(
+            cache, audio_file, model, language, temperature, task, word_timestamps, initial_prompt, verbose, input_hash
+        )
+    if transcription is None:
+        preprocessed_file = preprocess_audio(audio_file, preprocessed_file, verbose, preprocess_policy)
+    return input_hash, source_key, transcription, preprocessed_file
+
+def _upload(audio_file, preprocessed_file, limiter, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, verbose, client, cache, source_key, chunk_length, chunk_jobs, chunk_context, word_level, max_line_width):
+    # Returns (output file, transcription)
+    try:
+        transcription = transcribe_file(
+            preprocessed_file,
+            api_key,
+            model,
+            language,
+            temperature,
+            task,
+            word_timestamps,
+            initial_prompt,
+            verbose,
+            client,
+            cache,
+            source_key,
+            chunk_length,
+            chunk_jobs,
+            chunk_context,
+            limiter=limiter
+        )
+    finally:
+        if preprocessed_file != audio_file:
+            os.remove(preprocessed_file)
+    return save_transcription(audio_file, transcription, output_dir, output_format, verbose, word_level, max_line_width), transcription
+
+def run_batch(audio_files, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, jobs=1, preprocess_jobs=None, requests_per_minute=None, verbose=False, client=None, cache=None, chunk_length=None, chunk_jobs=4, chunk_context=False, word_level=False, max_line_width=None, manifest=None, preprocess_policy="balanced", corpus=None):
+    # ffmpeg already runs in its own process, so a thread pool is enough to keep
+    # `preprocess_jobs` encoders busy while up to `jobs` uploads are in flight.
+    # With a BatchManifest, every finished file is logged, and files it shows as
+    # already done with the same parameters are skipped. With a
+    # TranscriptCorpus, every transcription is also added to it; pass no
+    # `output_format` to write nothing else.
+    preprocess_jobs = preprocess_jobs or os.cpu_count() or 1
+    limiter = RateLimiter(requests_per_minute)
+    started = [None] * len(audio_files)
+    input_hashes = [None] * len(audio_files)
+    results = [
+        {"audio_file": audio_file, "output_file": None, "error": None, "elapsed": None, "skipped": False}
+        for audio_file in audio_files
+    ]
+    request_params = transcription_params(model, language, temperature, task, word_timestamps, initial_prompt)
+    params = dict(
+        request_params,
+        output_format=output_format,
+        word_level=word_level,
+        max_line_width=max_line_width
+    )
+
+    def finish(index, output_file=None, error=None, transcription=None):
+        if corpus is not None and error is None:
+            try:
+                corpus.add(audio_files[index], transcription, request_params, input_hashes[index])
+            except Exception as e:
+                output_file, error = None, e
+        results[index]["output_file"] = output_file
+        results[index]["error"] = error
+        results[index]["elapsed"] = time.monotonic() - started[index]
+        if manifest is not None:
+            manifest.record(
+                audio_files[index],
+                params,
+                input_hashes[index],
+                output_paths(output_file, output_format) if output_file else (),
+                error,
+                results[index]["elapsed"]
+            )
+        if verbose:
+            status = "done" if error is None else f"failed: {error}"
+            print(f"[{index + 1}/{len(audio_files)}] {audio_files[index]} {status}")
+
+    def prepare(index, *args):
+        # A file's elapsed time counts from the start of its own preprocessing
+        started[index] = time.monotonic()
+        return _prepare(*args)
+
+    def start_upload(future, index):
+        # Submits the upload of a preprocessed file; None if there is nothing to upload
+        try:
+            input_hashes[index], source_key, transcription, preprocessed_file = future.result()
+            if transcription is not None:
+                output_file = save_transcription(audio_files[index], transcription, output_dir, output_format, verbose, word_level, max_line_width)
+                finish(index, output_file=output_file, transcription=transcription)
+                return None
+        except Exception as e:
+            finish(index, error=e)
+            return None
+        return upload_pool.submit(
+            _upload,
+            audio_files[index],
+            preprocessed_file,
+            limiter,
+            api_key,
+            model,
+            language,
+            temperature,
+            task,
+            word_timestamps,
+            initial_prompt,
+            output_dir,
+            output_format,
+            verbose,
+            client,
+            cache,
+            source_key,
+            chunk_length,
+            chunk_jobs,
+            chunk_context,
+            word_level,
+            max_line_width
+        )
+
+    def finish_upload(future, index):
+        try:
+            output_file, transcription = future.result()
+        except Exception as e:
+            finish(index, error=e)
+        else:
+            finish(index, output_file=output_file, transcription=transcription)
+
+    work_dir = tempfile.mkdtemp(prefix="myspeech_batch_")
+    try:
+        with ThreadPoolExecutor(max_workers=preprocess_jobs) as preprocess_pool, \
+                ThreadPoolExecutor(max_workers=jobs) as upload_pool:
+            preprocessing = {}
+            uploading = {}
+            pending = set()
+            remaining = enumerate(audio_files)
+            # Files between the start of their preprocessing and the end of
+            # their upload; bounds the preprocessed files waiting in work_dir
+            max_ahead = preprocess_jobs + jobs
+
+            def submit_preprocessing():
+                while len(pending) < max_ahead:
+                    index, audio_file = next(remaining, (None, None))
+                    if index is None:
+                        return
+                    # With a corpus, entries still buffered when a run crashed are lost,
+                    # so the manifest alone can't say that a file is done
+                    if manifest is not None and manifest.is_done(audio_file, params) and \
+                            (corpus is None or corpus.contains(audio_file, request_params)):
+                        results[index].update(
+                            output_file=os.path.join(output_dir, os.path.basename(audio_file)), elapsed=0.0, skipped=True
+                        )
+                        if verbose:
+                            print(f"[{index + 1}/{len(audio_files)}] {audio_file} already done, skipping")
+                        continue
+                    # Prefix with the index so inputs sharing a basename don't collide
+                    name = os.path.splitext(os.path.basename(audio_file))[0]
+                    preprocessed_file = os.path.join(work_dir, f"{index}_{name}_preprocessed.mp3")
+                    future = preprocess_pool.submit(
+                        prepare,
+                        index,
+                        audio_file,
+                        preprocessed_file,
+                        cache,
+                        model,
+                        language,
+                        temperature,
+                        task,
+                        word_timestamps,
+                        initial_prompt,
+                        verbose,
+                        manifest is not None or corpus is not None,
+                        preprocess_policy
+                    )
+                    preprocessing[future] = index
+                    pending.add(future)
+
+            # Uploads are recorded as soon as they finish, not once all the
+            # preprocessing is over, so an interrupted run loses little work
+            submit_preprocessing()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending -= done
+                for future in done:
+                    if future in uploading:
+                        finish_upload(future, uploading[future])
+                        continue
+                    upload = start_upload(future, preprocessing[future])
+                    if upload is not None:
+                        uploading[upload] = preprocessing[future]
+                        pending.add(upload)
+                submit_preprocessing()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+def print_batch_summary(results):
+    failed = [result for result in results if result["error"] is not None]
+    skipped = [result for result in results if result.get("skipped")]
+    summary = f"\nSummary: {len(results) - len(failed) - len(skipped)} succeeded, {len(failed)} failed"
+    if skipped:
+        summary += f", {len(skipped)} skipped"
+    print(summary)
+    for result in results:
+        if result.get("skipped"):
+            print(f"  SKIP  {result['audio_file']} -> {result['output_file']} (already done)")
+        elif result["error"] is None:
+            print(f"  OK    {result['audio_file']} -> {result['output_file']} ({result['elapsed']:.2f}s)")
+        else:
+            print(f"  FAIL  {result['audio_file']}: {result['error']}")
+    return not failed
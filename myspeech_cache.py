@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "myspeech",
+    "transcriptions.sqlite3"
+)
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def transcription_params(model, language, temperature, task, word_timestamps, initial_prompt):
+    return {
+        "model": model,
+        "language": language,
+        "temperature": temperature,
+        "task": task,
+        "word_timestamps": bool(word_timestamps),
+        "prompt": initial_prompt,
+    }
+
+class TranscriptionCache:
+    # Results are keyed on the hash of the uploaded (preprocessed) audio plus the
+    # request parameters. A second table maps source-file keys to those entries so
+    # that an unchanged input can skip preprocessing entirely.
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=512 * 1024 * 1024, max_age=None, read=True):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.read = read
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS sources (
+                source_key TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+        """)
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def key(audio_hash, params):
+        return hash_bytes(f"{audio_hash}:{json.dumps(params, sort_keys=True)}".encode())
+
+    def get(self, key):
+        if not self.read:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT result FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        return json.loads(row[0])
+
+    def get_source(self, source_key):
+        if not self.read:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT key FROM sources WHERE source_key = ?", (source_key,)).fetchone()
+        return self.get(row[0]) if row else None
+
+    def put(self, key, result, source_key=None):
+        value = json.dumps(result)
+        now = time.time()
+        with self.lock:
+            previous = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, result, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            if source_key:
+                self.db.execute("INSERT OR REPLACE INTO sources (source_key, key) VALUES (?, ?)", (source_key, key))
+            self.db.commit()
+            self.total_bytes += len(value) - (previous[0] if previous else 0)
+            over_budget = self.max_bytes is not None and self.total_bytes > self.max_bytes
+        if over_budget:
+            self.prune()
+
+    def link_source(self, source_key, key):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO sources (source_key, key) VALUES (?, ?)", (source_key, key))
+            self.db.commit()
+
+    def prune(self, max_bytes=None, max_age=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        removed = 0
+        with self.lock:
+            if max_age is not None:
+                removed += self.db.execute("DELETE FROM entries WHERE accessed < ?", (time.time() - max_age,)).rowcount
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if max_bytes is not None and total > max_bytes:
+                # Evict least recently used entries until the cache fits again
+                to_delete = []
+                for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                    if total <= max_bytes:
+                        break
+                    to_delete.append((key,))
+                    total -= size
+                self.db.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+                removed += len(to_delete)
+            self.db.execute("DELETE FROM sources WHERE key NOT IN (SELECT key FROM entries)")
+            self.db.commit()
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return removed
@@ -0,0 +1,162 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from myspeech_metrics import span, record
+
+GROQ_API_BASE_URL = "https://api.groq.com/openai/v1"
+
+class TranscriptionError(Exception):
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"Error: {status_code}, {message}")
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after  # Seconds, when the server said when to come back
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TranscriptionClient:
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key, base_url=GROQ_API_BASE_URL, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=30.0, pool_size=10):
+        self.url = f"{base_url.rstrip('/')}/audio/transcriptions"
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self._session = None
+        self.session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Created on first use, so runs answered entirely from the cache never
+        # pay for importing requests
+        with self.session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                # One keep-alive pool shared by every request made through this client
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["Authorization"] = f"bearer {self.api_key}"
+                self._session = session
+            return self._session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: spread concurrent retries over the whole backoff window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def build_data(self, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None):
+        data = {
+            "model": model,
+            "temperature": temperature,
+            "response_format": "verbose_json" if word_timestamps else "json"
+        }
+        if language:
+            data["language"] = language
+        if task == "translate":
+            data["task"] = "translate"
+        if initial_prompt:
+            data["prompt"] = initial_prompt
+        if word_timestamps:
+            data["timestamp_granularities[]"] = ["word", "segment"]
+        return data
+
+    def send(self, audio, data, filename):
+        if isinstance(audio, (str, os.PathLike)):
+            with open(audio, "rb") as file:
+                return self.session.post(self.url, data=data, files={"file": file}, timeout=self.timeout)
+        # In-memory audio is sent as-is, so retries never need to rewind anything
+        return self.session.post(self.url, data=data, files={"file": (filename, audio)}, timeout=self.timeout)
+
+    def post(self, audio, data, verbose=False, filename="audio.wav"):
+        import requests
+
+        if hasattr(audio, "read"):
+            audio = audio.read()
+        if isinstance(audio, (bytearray, memoryview)):
+            audio = bytes(audio)
+        attempt = 0
+        while True:
+            try:
+                with span("upload", attempt=attempt):
+                    response = self.send(audio, data, filename)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                if verbose:
+                    print(f"Request to Groq API failed ({e}), retrying in {delay:.2f}s")
+            else:
+                delay = self.check_response(response, attempt, verbose)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+            attempt += 1
+
+    def check_response(self, response, attempt, verbose=False):
+        # Returns None for a successful response, otherwise how long to wait
+        # before retrying; raises TranscriptionError when it can't be retried
+        if response.status_code == 200:
+            # OpenAI-compatible servers may report their own processing time
+            processing_ms = response.headers.get("openai-processing-ms")
+            if processing_ms:
+                record("server", float(processing_ms) / 1000)
+            return None
+        if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+            if verbose:
+                print(f"Error response from Groq API: {response.status_code}")
+                print(f"Response content: {response.text}")
+            raise TranscriptionError(response.status_code, response.text, parse_retry_after(response.headers.get("Retry-After")))
+        delay = self.backoff_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+        if verbose:
+            print(f"Groq API returned {response.status_code}, retrying in {delay:.2f}s")
+        return delay
+
+    def transcribe(self, audio, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, filename="audio.wav"):
+        # `audio` is a file path, encoded audio bytes or a binary file object;
+        # `filename` tells the API how to decode in-memory audio.
+        data = self.build_data(model, language, temperature, task, word_timestamps, initial_prompt)
+
+        if verbose:
+            print("Sending request to Groq API:")
+            print(f"  URL: {self.url}")
+            print(f"  Data: {data}")
+
+        response = self.post(audio, data, verbose, filename)
+        if verbose:
+            print("Received successful response from Groq API")
+        result = response.json()
+        return result["text"] if not word_timestamps else result
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from myspeech_lib import truncate_prompt, MAX_PROMPT_WORDS, MAX_PROMPT_CHARS
+
+class ContextSource:
+    # Reads the text before the cursor in the focused application
+    def focus(self):
+        # Hashable key of the focused application/window, or None when it
+        # can't be told apart; cheap, called on every dictation
+        return None
+
+    def capture(self):
+        # Text before the cursor; slow (synthesized keystrokes, clipboard)
+        raise NotImplementedError
+
+class StaticContextSource(ContextSource):
+    # Serves fixed documents keyed by window, for tests and benchmarks.
+    # `capture_delay` models the cost of a real capture.
+    def __init__(self, documents=None, capture_delay=0.0):
+        self.documents = dict(documents or {})
+        self.window = None
+        self.capture_delay = capture_delay
+        self.captures = 0
+
+    def focus(self):
+        return self.window
+
+    def capture(self):
+        self.captures += 1
+        if self.capture_delay:
+            time.sleep(self.capture_delay)
+        return self.documents.get(self.window, "")
+
+class ContextProvider:
+    # Caches the tail of the text before the cursor per window. A capture is
+    # only made the first time a window is dictated into, or once its entry
+    # is older than `max_age` seconds (the user may have typed in between);
+    # dictated text is appended to the entry instead. Entries only hold the
+    # tail that fits in a prompt.
+    def __init__(self, source, max_words=MAX_PROMPT_WORDS, max_chars=MAX_PROMPT_CHARS, max_age=30.0, max_windows=32):
+        self.source = source
+        self.max_words = max_words
+        self.max_chars = max_chars
+        self.max_age = max_age
+        self.max_windows = max_windows
+        self.entries = OrderedDict()  # window -> [text, time captured]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self):
+        # Returns (window, context) for the focused window
+        window = self.source.focus()
+        with self.lock:
+            entry = self.entries.get(window) if window is not None else None
+            if entry is not None and time.monotonic() - entry[1] <= self.max_age:
+                self.entries.move_to_end(window)
+                self.hits += 1
+                return window, entry[0]
+            self.misses += 1
+        text = self.tail(self.source.capture() or "")
+        if window is not None:
+            self.store(window, text, time.monotonic())
+        return window, text
+
+    def get(self):
+        return self.lookup()[1]
+
+    def append(self, window, text):
+        # Records `text` as typed at the cursor of `window`
+        if window is None or not text:
+            return
+        with self.lock:
+            entry = self.entries.get(window)
+            if entry is None:
+                return
+            entry[0] = self.tail(f"{entry[0]} {text}")
+
+    def invalidate(self, window=None):
+        with self.lock:
+            if window is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(window, None)
+
+    def tail(self, text):
+        return truncate_prompt(text, self.max_words, self.max_chars)
+
+    def store(self, window, text, captured_at):
+        with self.lock:
+            self.entries[window] = [text, captured_at]
+            self.entries.move_to_end(window)
+            while len(self.entries) > self.max_windows:
+                self.entries.popitem(last=False)
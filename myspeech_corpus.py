@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from myspeech_cache import hash_file
+
+def corpus_format(path):
+    # The extension decides: .jsonl is a JSON lines log, anything else SQLite
+    return "jsonl" if path.lower().endswith(".jsonl") else "sqlite"
+
+def transcription_duration(transcription):
+    # End of the last segment, for verbose_json results
+    if isinstance(transcription, dict) and transcription.get("segments"):
+        return transcription["segments"][-1].get("end")
+    return None
+
+def corpus_entry(audio_file, transcription, params, input_hash=None):
+    try:
+        stat = os.stat(audio_file)
+        size, mtime = stat.st_size, stat.st_mtime
+    except OSError:
+        size = mtime = None
+    return {
+        "audio_file": os.path.abspath(audio_file),
+        "input_hash": input_hash,
+        "size": size,
+        "mtime": mtime,
+        "duration": transcription_duration(transcription),
+        "params": params,
+        "result": transcription,
+        "created": time.time(),
+    }
+
+class TranscriptCorpus:
+    # One store for the transcriptions of a whole archive instead of a handful
+    # of small files per input. Entries are buffered and written `batch_size`
+    # at a time, or once `flush_interval` seconds have passed since the last
+    # write. A file transcribed again with the same parameters replaces its
+    # entry. find() selects by source path, input hash and modification time
+    # of the input (roughly when it was recorded).
+    def __init__(self, path, batch_size=500, flush_interval=5.0):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.flushed_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, audio_file, transcription, params, input_hash=None):
+        if input_hash is None:
+            input_hash = hash_file(audio_file)
+        entry = corpus_entry(audio_file, transcription, params, input_hash)
+        with self.lock:
+            self.pending.append(entry)
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if self.pending:
+            self.write(self.pending)
+            self.pending = []
+        self.flushed_at = time.monotonic()
+
+    def write(self, entries):
+        raise NotImplementedError
+
+    def contains(self, audio_file, params):
+        # Whether a transcription of `audio_file` with `params` is stored (or pending)
+        return any(entry["params"] == params for entry in self.find(audio_file))
+
+    def find(self, audio_file=None, input_hash=None, since=None, until=None):
+        # Entries matching all the given criteria, ordered by path; `since`
+        # and `until` are timestamps bounding the input's modification time
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+class SQLiteCorpus(TranscriptCorpus):
+    def __init__(self, path, batch_size=500, flush_interval=5.0):
+        super().__init__(path, batch_size, flush_interval)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS transcripts (
+                id INTEGER PRIMARY KEY,
+                audio_file TEXT NOT NULL,
+                params TEXT NOT NULL,
+                input_hash TEXT,
+                size INTEGER,
+                mtime REAL,
+                duration REAL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                UNIQUE (audio_file, params)
+            );
+            CREATE INDEX IF NOT EXISTS transcripts_input_hash ON transcripts (input_hash);
+            CREATE INDEX IF NOT EXISTS transcripts_mtime ON transcripts (mtime);
+        """)
+
+    def write(self, entries):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO transcripts (audio_file, params, input_hash, size, mtime, duration, result, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(entry["audio_file"], json.dumps(entry["params"], sort_keys=True), entry["input_hash"], entry["size"],
+              entry["mtime"], entry["duration"], json.dumps(entry["result"]), entry["created"]) for entry in entries]
+        )
+        self.db.commit()
+
+    def find(self, audio_file=None, input_hash=None, since=None, until=None):
+        conditions, values = [], []
+        for condition, value in (("audio_file = ?", None if audio_file is None else os.path.abspath(audio_file)),
+                                 ("input_hash = ?", input_hash), ("mtime >= ?", since), ("mtime < ?", until)):
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+        query = "SELECT audio_file, params, input_hash, size, mtime, duration, result, created FROM transcripts"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.lock:
+            self.flush_locked()
+            rows = self.db.execute(query + " ORDER BY audio_file, created", values).fetchall()
+        return [
+            {"audio_file": row[0], "params": json.loads(row[1]), "input_hash": row[2], "size": row[3], "mtime": row[4],
+             "duration": row[5], "result": json.loads(row[6]), "created": row[7]}
+            for row in rows
+        ]
+
+    def close(self):
+        super().close()
+        with self.lock:
+            self.db.close()
+
+class JSONLCorpus(TranscriptCorpus):
+    # A JSON line per entry, appended; the last line for a path and set of
+    # parameters wins. The index (byte offsets by path) is built in memory
+    # with one pass over the file the first time it is searched.
+    def __init__(self, path, batch_size=500, flush_interval=5.0):
+        super().__init__(path, batch_size, flush_interval)
+        self.file = open(path, "a+b")
+        if self.file.tell() and os.pread(self.file.fileno(), 1, self.file.tell() - 1) != b"\n":
+            self.file.write(b"\n")  # Don't append to a torn last line
+        self.index = None
+
+    def write(self, entries):
+        lines = [json.dumps(entry).encode() + b"\n" for entry in entries]
+        offset = self.file.tell()
+        self.file.write(b"".join(lines))
+        self.file.flush()
+        if self.index is not None:
+            for entry, line in zip(entries, lines):
+                self.index_entry(entry, offset)
+                offset += len(line)
+
+    def index_entry(self, entry, offset):
+        key = (entry["audio_file"], json.dumps(entry["params"], sort_keys=True))
+        self.index[key] = (offset, entry["input_hash"], entry["mtime"])
+
+    def load_index(self):
+        self.index = {}
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    self.index_entry(json.loads(line), offset)
+                except ValueError:
+                    pass  # Torn last line from an interrupted run
+                offset += len(line)
+
+    def find(self, audio_file=None, input_hash=None, since=None, until=None):
+        audio_file = None if audio_file is None else os.path.abspath(audio_file)
+        with self.lock:
+            self.flush_locked()
+            if self.index is None:
+                self.load_index()
+            matches = sorted(
+                (key[0], offset) for key, (offset, entry_hash, mtime) in self.index.items()
+                if (audio_file is None or key[0] == audio_file)
+                and (input_hash is None or entry_hash == input_hash)
+                and (since is None or (mtime is not None and mtime >= since))
+                and (until is None or (mtime is not None and mtime < until))
+            )
+        entries = []
+        with open(self.path, "rb") as f:
+            for _, offset in matches:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def close(self):
+        super().close()
+        with self.lock:
+            self.file.close()
+
+def open_corpus(path, batch_size=500, flush_interval=5.0):
+    corpus_class = JSONLCorpus if corpus_format(path) == "jsonl" else SQLiteCorpus
+    return corpus_class(path, batch_size, flush_interval)
+
+def parse_time(value):
+    # A Unix timestamp or an ISO date/time such as 2024-05-01 or 2024-05-01T14:00
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def main(argv=None):
+    from myspeech_lib import save_output, OUTPUT_FORMATS
+
+    parser = argparse.ArgumentParser(prog="myspeech export",
+                                     description="List transcripts in a corpus or write them out as per-file outputs")
+    parser.add_argument("corpus", help="corpus written by myspeech --corpus (.sqlite3 or .jsonl)")
+    parser.add_argument("audio", nargs="*", help="only these source files")
+    parser.add_argument("--hash", help="only the input with this SHA-256 hash")
+    parser.add_argument("--since", type=parse_time,
+                        help="only inputs modified at or after this time (ISO date/time or Unix timestamp)")
+    parser.add_argument("--until", type=parse_time, help="only inputs modified before this time")
+    parser.add_argument("--list", action="store_true", help="print the matching entries instead of writing files")
+    parser.add_argument("--output_dir", "-o", default=".", help="directory to save the outputs")
+    parser.add_argument("--output_format", "-f", choices=list(OUTPUT_FORMATS) + ["all"], default="all",
+                        help="format of the output files (default: all)")
+    parser.add_argument("--word_level", action="store_true",
+                        help="build subtitle cues from word timings instead of segments")
+    parser.add_argument("--max_line_width", type=int,
+                        help="maximum number of characters in a subtitle cue before it is split")
+    parser.add_argument("--verbose", action="store_true", help="print out progress and debug messages")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.corpus):
+        parser.error(f"{args.corpus} does not exist")
+    with open_corpus(args.corpus) as corpus:
+        entries = []
+        for audio_file in args.audio or [None]:
+            entries += corpus.find(audio_file, args.hash, args.since, args.until)
+
+    if args.list:
+        for entry in entries:
+            duration = f"{entry['duration']:.1f}s" if entry["duration"] is not None else "-"
+            modified = datetime.fromtimestamp(entry["mtime"]).isoformat(timespec="seconds") if entry["mtime"] else "-"
+            print(f"{entry['audio_file']}\t{entry['input_hash']}\t{modified}\t{duration}\t{entry['params']['model']}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for entry in entries:
+        output_file = os.path.join(args.output_dir, os.path.basename(entry["audio_file"]))
+        save_output(entry["result"], output_file, args.output_format, args.verbose,
+                    args.word_level, args.max_line_width)
+    print(f"Exported {len(entries)} transcript(s) to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
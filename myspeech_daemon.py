@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# Long-lived transcription server. Keeps the imports, the pooled HTTP
+# connections to the API, the microphone stream and the cache warm, and
+# serves jobs from any number of myspeech_remote clients over a Unix socket.
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from myspeech_lib import process_audio, record_audio_with_vad
+from myspeech_client import TranscriptionClient
+from myspeech_cache import TranscriptionCache, DEFAULT_CACHE_PATH
+from myspeech_audio import PyAudioSource
+from myspeech_metrics import set_sink, create_sink, METRICS_FORMATS
+from myspeech_remote import DEFAULT_SOCKET_PATH
+
+# Request fields forwarded to process_audio, with their defaults
+JOB_OPTIONS = {
+    "language": None,
+    "temperature": 0,
+    "task": "transcribe",
+    "word_timestamps": False,
+    "initial_prompt": None,
+    "output_dir": ".",
+    "output_format": "all",
+    "chunk_length": None,
+    "chunk_jobs": 4,
+    "chunk_context": False,
+    "word_level": False,
+    "max_line_width": None,
+}
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def send(self, event, **fields):
+        self.wfile.write(json.dumps({"event": event, **fields}).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            if handler is None:
+                raise ValueError(f"Unknown operation {request.get('op')!r}")
+            handler(request)
+        except BrokenPipeError:
+            pass  # The client went away; its queued jobs still run
+        except Exception as e:
+            self.send("error", error=str(e))
+
+    def op_ping(self, request):
+        self.send("status", queued=self.server.queued, active=self.server.active)
+
+    def op_shutdown(self, request):
+        self.send("stopping")
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def op_transcribe(self, request):
+        options = self.server.job_options(request)
+        jobs = {self.server.submit(audio_file, options): audio_file for audio_file in request["audio_files"]}
+        self.send("queued", jobs=len(jobs), position=self.server.queued)
+        self.stream_results(jobs)
+
+    def op_record(self, request):
+        options = self.server.job_options(request)
+        self.send("recording")
+        pcm = self.server.record()
+        output_name = time.strftime("recording-%Y%m%d-%H%M%S")
+        self.stream_results({self.server.submit(pcm, options, output_name=output_name): output_name})
+
+    def stream_results(self, jobs):
+        for future in as_completed(jobs):
+            try:
+                output_file, elapsed = future.result()
+            except Exception as e:
+                self.send("error", audio_file=jobs[future], error=str(e))
+            else:
+                self.send("done", audio_file=jobs[future], output_file=output_file, elapsed=elapsed)
+
+class TranscriptionDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # One thread per connection; the jobs of every client share a single queue
+    # of `jobs` workers, so the API sees the same concurrency however many
+    # clients are connected.
+    daemon_threads = True
+
+    def __init__(self, socket_path, api_key, model, client, cache=None, jobs=4, verbose=False):
+        self.socket_path = socket_path
+        self.api_key = api_key
+        self.model = model
+        self.client = client
+        self.cache = cache
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        # Preprocessed files go here rather than next to the inputs, where
+        # two jobs on the same file would overwrite each other's
+        self.work_dir = tempfile.mkdtemp(prefix="myspeech_daemon_")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.audio_source = None
+        self.record_lock = threading.Lock()
+        remove_stale_socket(socket_path)
+        super().__init__(socket_path, DaemonHandler)
+        # The daemon spends the owner's API key; keep other users off the socket
+        os.chmod(socket_path, 0o600)
+
+    def job_options(self, request):
+        options = {name: request.get(name, default) for name, default in JOB_OPTIONS.items()}
+        options["model"] = request.get("model") or self.model
+        os.makedirs(options["output_dir"], exist_ok=True)
+        return options
+
+    def submit(self, audio, options, output_name="recording"):
+        with self.lock:
+            self.queued += 1
+        return self.executor.submit(self.run_job, audio, options, output_name)
+
+    def run_job(self, audio, options, output_name):
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        started = time.monotonic()
+        try:
+            output_file = process_audio(
+                audio,
+                self.api_key,
+                options["model"],
+                options["language"],
+                options["temperature"],
+                options["task"],
+                options["word_timestamps"],
+                options["initial_prompt"],
+                options["output_dir"],
+                options["output_format"],
+                self.verbose,
+                self.client,
+                output_name=output_name,
+                cache=self.cache,
+                chunk_length=options["chunk_length"],
+                chunk_jobs=options["chunk_jobs"],
+                chunk_context=options["chunk_context"],
+                word_level=options["word_level"],
+                max_line_width=options["max_line_width"],
+                work_dir=self.work_dir
+            )
+            return output_file, time.monotonic() - started
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def record(self):
+        # Only one microphone; concurrent --record requests take turns
+        with self.record_lock:
+            if self.audio_source is None:
+                self.audio_source = PyAudioSource(keep_warm=True)
+            return record_audio_with_vad(verbose=self.verbose, source=self.audio_source)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        if self.audio_source is not None:
+            self.audio_source.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+def remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)  # Left behind by a daemon that died
+    else:
+        raise RuntimeError(f"A myspeech daemon is already running at {socket_path}")
+    finally:
+        probe.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve transcription jobs over a Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                        help=f"path of the Unix socket to listen on (default: {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--model", default="distil-whisper-large-v3-en",
+                        help="name of the Whisper model used when a job does not name one")
+    parser.add_argument("--jobs", "-j", type=int, default=4,
+                        help="number of jobs to process concurrently across all clients (default: 4)")
+    parser.add_argument("--connect_timeout", type=float, default=5.0,
+                        help="seconds to wait for a connection to the API (default: 5)")
+    parser.add_argument("--read_timeout", type=float, default=120.0,
+                        help="seconds to wait for the API to respond (default: 120)")
+    parser.add_argument("--max_retries", type=int, default=3,
+                        help="number of times to retry rate-limited or failed requests (default: 3)")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse transcriptions of unchanged audio from the on-disk cache")
+    parser.add_argument("--cache_path", default=DEFAULT_CACHE_PATH,
+                        help=f"location of the transcription cache (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--cache_max_size", type=float, default=512,
+                        help="maximum size of the cache in MB (default: 512)")
+    parser.add_argument("--cache_max_age", type=float,
+                        help="evict cache entries unused for this many days")
+    parser.add_argument("--metrics",
+                        help="write per-stage timings (preprocessing, upload, server time, saving) to this file")
+    parser.add_argument("--metrics_format", choices=sorted(METRICS_FORMATS), default="jsonl",
+                        help="format of the --metrics file (default: jsonl)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="print out progress and debug messages")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY environment variable is not set")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    metrics_sink = None
+    if args.metrics:
+        metrics_sink = create_sink(args.metrics, args.metrics_format)
+        set_sink(metrics_sink)
+
+    cache = None
+    if args.cache:
+        cache = TranscriptionCache(
+            args.cache_path,
+            max_bytes=int(args.cache_max_size * 1024 * 1024),
+            max_age=args.cache_max_age * 86400 if args.cache_max_age is not None else None
+        )
+
+    # Let `kill` clean up the socket like Ctrl-C does
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with TranscriptionClient(
+        api_key,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        max_retries=args.max_retries,
+        pool_size=args.jobs
+    ) as client:
+        server = TranscriptionDaemon(args.socket, api_key, args.model, client, cache, args.jobs, args.verbose)
+        print(f"myspeech daemon listening on {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    if cache is not None:
+        cache.close()
+    if metrics_sink is not None:
+        metrics_sink.close()
+
+if __name__ == "__main__":
+    main()
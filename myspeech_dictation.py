@@ -0,0 +1,200 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from myspeech_metrics import record
+
+PROCESSING_MARK = '[...]'
+RECORDING_MARK = '[REC]'
+
+# Dictation states, in order
+RECORDING = "recording"
+TRANSCRIBING = "transcribing"
+TRANSCRIBED = "transcribed"  # Waiting for earlier dictations to be pasted
+DONE = "done"
+FAILED = "failed"
+
+class Dictation:
+    def __init__(self, number):
+        self.number = number
+        self.state = RECORDING
+        self.stop_event = threading.Event()
+        self.prompt = Future()  # Set once the context has been read
+        self.text = None
+        self.error = None
+        self.requested_at = time.perf_counter()
+        self.speech_ended_at = None
+
+class DictationBackend:
+    # What the queue drives. prepare, show, paste and idle run on one UI
+    # thread, in the order the dictations were requested; record runs on the
+    # recording thread and transcribe on a worker pool.
+    def requested(self, dictation):
+        # Called from toggle(); must not block
+        pass
+
+    def prepare(self, dictation):
+        # Returns the prompt for the dictation (e.g. the text before the cursor)
+        return None
+
+    def record(self, dictation):
+        # Returns the recorded PCM; returns early once dictation.stop_event is set
+        raise NotImplementedError
+
+    def transcribe(self, dictation, pcm):
+        raise NotImplementedError
+
+    def show(self, old, new):
+        # Replaces the marks `old` typed at the cursor with `new`
+        pass
+
+    def paste(self, dictation, text):
+        raise NotImplementedError
+
+    def idle(self):
+        # Nothing is pending any more
+        pass
+
+class DictationQueue:
+    # Each toggle() starts a dictation, or stops the one being recorded. A new
+    # dictation can be recorded while earlier ones are still uploading; their
+    # texts are pasted strictly in request order. The cursor shows one mark
+    # per pending dictation: RECORDING_MARK while it records, then
+    # PROCESSING_MARK until it is pasted. At most `max_pending` dictations are
+    # in flight; toggles beyond that are ignored.
+    def __init__(self, backend, workers=2, max_pending=4):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.current = None
+        self.count = 0
+        self.shown = ""
+        self.requests = queue.SimpleQueue()
+        self.workers = ThreadPoolExecutor(max_workers=workers)
+        self.ui = ThreadPoolExecutor(max_workers=1)
+        self.recorder = threading.Thread(target=self.run_recorder, daemon=True)
+        self.recorder.start()
+
+    @property
+    def recording(self):
+        return self.current is not None
+
+    def toggle(self):
+        # Returns the dictation that was started or stopped, or None
+        with self.lock:
+            dictation = self.current
+            if dictation is not None:
+                dictation.stop_event.set()
+                return dictation
+            if len(self.pending) >= self.max_pending:
+                return None
+            self.count += 1
+            dictation = self.current = Dictation(self.count)
+            self.pending.append(dictation)
+        self.backend.requested(dictation)
+        self.requests.put(dictation)
+        return dictation
+
+    def close(self, wait=True):
+        # Stops the current recording; with `wait`, pending dictations are
+        # still pasted
+        with self.lock:
+            if self.current is not None:
+                self.current.stop_event.set()
+        self.requests.put(None)
+        self.recorder.join()
+        self.workers.shutdown(wait=wait, cancel_futures=not wait)
+        self.ui.shutdown(wait=wait, cancel_futures=not wait)
+
+    def run_recorder(self):
+        while True:
+            dictation = self.requests.get()
+            if dictation is None:
+                return
+            self.post(self.begin, dictation)
+            try:
+                pcm = self.backend.record(dictation)
+            except Exception as e:
+                pcm = None
+                self.fail(dictation, e)
+            dictation.speech_ended_at = time.perf_counter()
+            with self.lock:
+                self.current = None
+                dictation.state = TRANSCRIBING if dictation.error is None else FAILED
+            if dictation.error is None:
+                self.workers.submit(self.transcribe, dictation, pcm)
+            self.post(self.deliver)
+
+    def post(self, function, *args):
+        try:
+            self.ui.submit(function, *args)
+        except RuntimeError:
+            pass  # Closed without waiting
+
+    def fail(self, dictation, error):
+        self.logger.error(f"Dictation {dictation.number} failed: {error}")
+        dictation.error = error
+
+    def transcribe(self, dictation, pcm):
+        try:
+            dictation.text = self.backend.transcribe(dictation, pcm)
+        except Exception as e:
+            self.fail(dictation, e)
+        with self.lock:
+            dictation.state = TRANSCRIBED if dictation.error is None else FAILED
+        self.post(self.deliver)
+
+    # The methods below run on the UI thread
+
+    def begin(self, dictation):
+        try:
+            dictation.prompt.set_result(self.backend.prepare(dictation))
+        except Exception as e:
+            self.logger.error(f"Could not read the context: {e}")
+            dictation.prompt.set_result(None)
+        self.render()
+
+    def marks(self):
+        # Dictations get their mark once their context has been read
+        with self.lock:
+            return "".join(
+                RECORDING_MARK if d.state == RECORDING else PROCESSING_MARK
+                for d in self.pending if d.prompt.done()
+            )
+
+    def render(self):
+        marks = self.marks()
+        if marks != self.shown:
+            self.backend.show(self.shown, marks)
+            self.shown = marks
+
+    def deliver(self):
+        # Pastes the finished dictations at the head of the queue
+        while True:
+            with self.lock:
+                if not self.pending or self.pending[0].state not in (TRANSCRIBED, FAILED):
+                    break
+                dictation = self.pending.popleft()
+            # The marks are all after the pasted text
+            self.backend.show(self.shown, "")
+            self.shown = ""
+            if dictation.error is None and dictation.text:
+                try:
+                    self.backend.paste(dictation, dictation.text)
+                except Exception as e:
+                    self.fail(dictation, e)
+            dictation.state = DONE if dictation.error is None else FAILED
+            if dictation.error is None:
+                finished_at = time.perf_counter()
+                record("post_speech", finished_at - dictation.speech_ended_at)
+                record("dictation", finished_at - dictation.requested_at)
+        self.render()
+        with self.lock:
+            idle = not self.pending
+        if idle:
+            self.backend.idle()
@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from myspeech_metrics import LatencyHistogram, record
+
+class HedgedTranscriptionClient:
+    # Wraps a TranscriptionClient for interactive use. When a request hasn't
+    # answered after the hedge delay, a duplicate is sent (to `fallback_model`
+    # if given) and the first success wins. The delay is `hedge_delay` if
+    # set, otherwise the `hedge_percentile` of the latencies seen so far, so
+    # only that share of requests gets hedged. With a `deadline`, an empty
+    # transcription is returned once it passes; `hedge=False` keeps only the
+    # deadline. A request that lost the race can't be aborted and finishes in
+    # the background.
+    def __init__(self, client, hedge_percentile=95, hedge_delay=None, initial_delay=1.0, min_delay=0.05,
+                 max_delay=10.0, min_samples=20, fallback_model=None, deadline=None, hedge=True):
+        self.client = client
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.fallback_model = fallback_model
+        self.deadline = deadline
+        self.histogram = LatencyHistogram()
+        self.pool = ThreadPoolExecutor(max_workers=2 * client.pool_size)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadlines_missed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.client.close()
+
+    def current_hedge_delay(self):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        if self.histogram.count < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, self.histogram.percentile(self.hedge_percentile)))
+
+    def request(self, audio, model, args, observe):
+        start = time.perf_counter()
+        result = self.client.transcribe(audio, model, *args)
+        # Slow requests that lost the race are counted too, or the
+        # percentile would only ever see the fast ones
+        if observe:
+            self.histogram.observe(time.perf_counter() - start)
+        return result
+
+    def transcribe(self, audio, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, filename="audio.wav", deadline=None):
+        # Same arguments as TranscriptionClient.transcribe; `deadline`
+        # overrides the client's for this call
+        if hasattr(audio, "read"):
+            audio = audio.read()  # Both requests upload the same bytes
+        args = (language, temperature, task, word_timestamps, initial_prompt, verbose, filename)
+        deadline = self.deadline if deadline is None else deadline
+        start = time.perf_counter()
+        deadline_at = start + deadline if deadline else None
+        hedge_at = start + self.current_hedge_delay() if self.hedge else None
+
+        names = {self.pool.submit(self.request, audio, model, args, True): "primary"}
+        pending = set(names)
+        error = None
+        while pending:
+            wake_at = [at for at in (None if len(names) > 1 else hedge_at, deadline_at) if at is not None]
+            timeout = max(0.0, min(wake_at) - time.perf_counter()) if wake_at else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = names[future]
+                    if winner == "hedge":
+                        self.hedge_wins += 1
+                    record("hedge", time.perf_counter() - start, hedged=len(names) > 1, winner=winner)
+                    return future.result()
+                error = future.exception()
+            now = time.perf_counter()
+            if deadline_at is not None and now >= deadline_at:
+                break
+            if pending and hedge_at is not None and len(names) == 1 and now >= hedge_at:
+                hedge_model = self.fallback_model or model
+                if verbose:
+                    print(f"No response after {now - start:.2f}s, sending a hedged request ({hedge_model})")
+                self.hedges += 1
+                hedge = self.pool.submit(self.request, audio, hedge_model, args, hedge_model == model)
+                names[hedge] = "hedge"
+                pending.add(hedge)
+
+        if not pending:
+            raise error
+        self.deadlines_missed += 1
+        record("hedge", time.perf_counter() - start, hedged=len(names) > 1, winner="deadline")
+        if verbose:
+            print(f"No transcription within the {deadline:.2f}s deadline")
+        return "" if not word_timestamps else {"text": "", "segments": []}
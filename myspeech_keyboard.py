@@ -0,0 +1,245 @@
+import logging
+import time
+from contextlib import contextmanager
+
+# Applications only read this many UTF-16 code units from the string
+# attached to one keyboard event; longer strings are cut off silently
+MAX_UNICODE_EVENT_LENGTH = 20
+
+KEY_MAP = {
+    'a': 0x00, 'b': 0x0B, 'c': 0x08, 'd': 0x02, 'e': 0x0E, 'f': 0x03, 'g': 0x05,
+    'h': 0x04, 'i': 0x22, 'j': 0x26, 'k': 0x28, 'l': 0x25, 'm': 0x2E, 'n': 0x2D,
+    'o': 0x1F, 'p': 0x23, 'q': 0x0C, 'r': 0x0F, 's': 0x01, 't': 0x11, 'u': 0x20,
+    'v': 0x09, 'w': 0x0D, 'x': 0x07, 'y': 0x10, 'z': 0x06,
+    '1': 0x12, '2': 0x13, '3': 0x14, '4': 0x15, '5': 0x17, '6': 0x16, '7': 0x1A,
+    '8': 0x1C, '9': 0x19, '0': 0x1D,
+    '\n': 0x24, '\t': 0x30, ' ': 0x31, '-': 0x1B, '=': 0x18, '[': 0x21, ']': 0x1E,
+    '\\': 0x2A, ';': 0x29, "'": 0x27, ',': 0x2B, '.': 0x2F, '/': 0x2C, '`': 0x32,
+    'left': 0x7B, 'right': 0x7C, 'up': 0x7E, 'down': 0x7D,
+    'backspace': 0x33, 'delete': 0x75, 'cmd': 0x37, 'shift': 0x38, 'caps': 0x39,
+    'option': 0x3A, 'ctrl': 0x3B, 'esc': 0x35,
+    'f1': 0x7A, 'f2': 0x78, 'f3': 0x63, 'f4': 0x76,
+    'f5': 0x60, 'f6': 0x61, 'f7': 0x62, 'f8': 0x64,
+    'f9': 0x65, 'f10': 0x6D, 'f11': 0x67, 'f12': 0x6F,
+    'home': 0x73, 'end': 0x77, 'pageup': 0x74, 'pagedown': 0x79,
+    'return': 0x24, 'enter': 0x4C, 'tab': 0x30,
+    'space': 0x31, 'capslock': 0x39,
+    'numlock': 0x47, 'function': 0x3F,
+}
+
+MODIFIER_KEYS = {
+    'cmd': 0x100000,
+    'command': 0x100000, # alias for cmd
+    'shift': 0x20000,
+    'option': 0x80000,
+    'ctrl': 0x40000,
+    'capslock': 0x10000,
+    'fn': 0x800000,
+}
+
+# Characters typed as shift + another key on a US layout
+SHIFTED_CHARS = {
+    '!': '1', '@': '2', '#': '3', '$': '4', '%': '5', '^': '6', '&': '7', '*': '8',
+    '(': '9', ')': '0', '_': '-', '+': '=', '{': '[', '}': ']', '|': '\\', ':': ';',
+    '"': "'", '<': ',', '>': '.', '?': '/', '~': '`',
+}
+
+def unicode_chunks(text, size=MAX_UNICODE_EVENT_LENGTH):
+    # Splits `text` into pieces of at most `size` UTF-16 code units without
+    # separating the halves of a surrogate pair
+    chunk, length = [], 0
+    for char in text:
+        units = 2 if ord(char) > 0xFFFF else 1
+        if length + units > size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+        chunk.append(char)
+        length += units
+    if chunk:
+        yield ''.join(chunk)
+
+class KeyboardBackend:
+    # Posts synthetic keyboard events to the focused application
+    def post_key(self, key_code, key_down, flags=0):
+        raise NotImplementedError
+
+    def post_text(self, text):
+        # Types `text` (at most MAX_UNICODE_EVENT_LENGTH UTF-16 code units)
+        # with a single key down/up pair carrying the string
+        raise NotImplementedError
+
+class QuartzKeyboardBackend(KeyboardBackend):
+    def __init__(self):
+        import Quartz
+        self.quartz = Quartz
+
+    def create_event(self, key_code, key_down, flags):
+        event = self.quartz.CGEventCreateKeyboardEvent(None, key_code, key_down)
+        # Set explicitly so that modifiers still held by the user don't leak in
+        self.quartz.CGEventSetFlags(event, flags)
+        return event
+
+    def post_key(self, key_code, key_down, flags=0):
+        self.quartz.CGEventPost(self.quartz.kCGHIDEventTap, self.create_event(key_code, key_down, flags))
+
+    def post_text(self, text):
+        length = len(text.encode('utf-16-le')) // 2
+        for key_down in (True, False):
+            event = self.create_event(0, key_down, 0)
+            self.quartz.CGEventKeyboardSetUnicodeString(event, length, text)
+            self.quartz.CGEventPost(self.quartz.kCGHIDEventTap, event)
+
+class RecordingKeyboardBackend(KeyboardBackend):
+    # Keeps the events instead of posting them, for tests and benchmarks.
+    # `event_cost` seconds are spent on each event to model the cost of
+    # posting it.
+    def __init__(self, event_cost=0.0):
+        self.event_cost = event_cost
+        self.events = []
+
+    def spend(self):
+        if self.event_cost:
+            time.sleep(self.event_cost)
+
+    def post_key(self, key_code, key_down, flags=0):
+        self.events.append(("key", key_code, key_down, flags))
+        self.spend()
+
+    def post_text(self, text):
+        for key_down in (True, False):
+            self.events.append(("text", text, key_down))
+            self.spend()
+
+    def typed_text(self):
+        # What an editor would show after the recorded events
+        names = {code: name for name, code in reversed(KEY_MAP.items())}
+        shifted = {base: char for char, base in SHIFTED_CHARS.items()}
+        text = []
+        for event in self.events:
+            if event[0] == "text":
+                if event[2]:
+                    text.append(event[1])
+                continue
+            _, key_code, key_down, flags = event
+            name = names.get(key_code)
+            if not key_down or name is None or flags & ~MODIFIER_KEYS['shift']:
+                continue
+            if name == 'backspace':
+                if text:
+                    text[-1] = text[-1][:-1]
+                    if not text[-1]:
+                        text.pop()
+            elif name in ('return', 'tab', 'space') or len(name) == 1:
+                char = {'return': '\n', 'tab': '\t', 'space': ' '}.get(name, name)
+                if flags & MODIFIER_KEYS['shift']:
+                    char = shifted.get(char, char.upper())
+                text.append(char)
+        return ''.join(text)
+
+class MacOSKeyboardController:
+    # With `batch`, strings are typed as unicode string events, up to
+    # MAX_UNICODE_EVENT_LENGTH characters per event pair and independent of
+    # the keyboard layout. Without it every character is its own keystroke,
+    # for applications that ignore the string attached to an event.
+    def __init__(self, backend=None, batch=True):
+        self.backend = backend if backend is not None else QuartzKeyboardBackend()
+        self.batch = batch
+        self.key_map = KEY_MAP
+        self.modifier_keys = MODIFIER_KEYS
+        self.logger = logging.getLogger(__name__)
+
+    def flags(self, modifiers):
+        flags = 0
+        for mod in modifiers or ():
+            flags |= self.modifier_keys.get(mod.lower(), 0)
+        return flags
+
+    def press_key(self, key, modifiers=None):
+        try:
+            key_code = self.key_map.get(key.lower())
+            if key_code is not None:
+                self.backend.post_key(key_code, True, self.flags(modifiers))
+        except Exception as e:
+            self.logger.error(f"Error pressing key {key}: {str(e)}")
+
+    def release_key(self, key, modifiers=None):
+        try:
+            key_code = self.key_map.get(key.lower())
+            if key_code is not None:
+                self.backend.post_key(key_code, False, self.flags(modifiers))
+        except Exception as e:
+            self.logger.error(f"Error releasing key {key}: {str(e)}")
+
+    def type_with_modifiers(self, key, modifiers):
+        # The modifiers travel as flags on the events themselves, so there is
+        # nothing to wait for between press and release
+        self.press_key(key, modifiers)
+        self.release_key(key, modifiers)
+
+    def type_special_char(self, char):
+        if char in SHIFTED_CHARS:
+            self.type_with_modifiers(SHIFTED_CHARS[char], ['shift'])
+        else:
+            self.press_and_release(char)
+
+    def type_string(self, string):
+        if not self.batch:
+            self.type_keystrokes(string)
+            return
+        # Newlines go out as Return so that editors apply their own
+        # indentation and line handling
+        for i, line in enumerate(string.split('\n')):
+            if i:
+                self.press_and_release('return')
+            for chunk in unicode_chunks(line):
+                try:
+                    self.backend.post_text(chunk)
+                except Exception as e:
+                    self.logger.error(f"Error typing {chunk!r}: {str(e)}")
+
+    def type_keystrokes(self, string):
+        for char in string:
+            if char.isupper() and char.lower() in self.key_map:
+                self.type_with_modifiers(char.lower(), ['shift'])
+            elif char in self.key_map:
+                self.press_and_release(char)
+            else:
+                self.type_special_char(char)
+
+    def backspace(self, count):
+        for _ in range(count):
+            self.press_and_release('backspace')
+
+    def replace_text(self, old, new):
+        # Turns `old`, just typed before the cursor, into `new`: only the part
+        # after their common prefix is erased and retyped
+        common = 0
+        for a, b in zip(old, new):
+            if a != b:
+                break
+            common += 1
+        self.backspace(len(old) - common)
+        if new[common:]:
+            self.type_string(new[common:])
+
+    def press_and_release(self, key, modifiers=None):
+        self.press_key(key, modifiers)
+        self.release_key(key, modifiers)
+
+    def key_combination(self, *keys):
+        modifiers = [key for key in keys if key in self.modifier_keys]
+        regular_keys = [key for key in keys if key not in self.modifier_keys]
+        for key in regular_keys:
+            self.press_key(key, modifiers)
+        for key in reversed(regular_keys):
+            self.release_key(key, modifiers)
+
+    @contextmanager
+    def hold_keys(self, *keys):
+        for key in keys:
+            self.press_key(key)
+        try:
+            yield
+        finally:
+            for key in reversed(keys):
+                self.release_key(key)
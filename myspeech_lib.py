@@ -1,131 +1,379 @@
 import os
-import requests
+import io
 import json
+import shutil
 import subprocess
-import pyaudio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import time
 import wave
-import webrtcvad
-import numpy as np
-from array import array
-from struct import pack
-import csv
+from contextlib import ExitStack
+from myspeech_client import TranscriptionClient
+from myspeech_cache import hash_file, transcription_params
+from myspeech_probe import probe_audio, choose_preprocessing, audio_duration, REMUX_EXTENSIONS
+from myspeech_subtitles import SUBTITLE_WRITERS, write_subtitles
+from myspeech_metrics import span, record
+from myspeech_audio import CaptureBuffer, PyAudioSource, SpeechEndpointer, speech_mask, trim_silence, SAMPLE_RATE, SAMPLE_WIDTH, VAD_FRAME_MS, VAD_FRAME_BYTES
 
-def preprocess_audio(input_file, output_file, verbose=False):
+PREPROCESSED_BYTES_PER_SECOND = 32000 // 8  # Duration estimate for files ffprobe can't read
+
+MAX_PROMPT_WORDS = 128
+MAX_PROMPT_CHARS = 896
+
+# ffmpeg output options for in-memory uploads; "wav" is encoded in-process
+UPLOAD_ENCODINGS = {
+    "wav": None,
+    "flac": ['-acodec', 'flac', '-f', 'flac'],
+    "mp3": ['-b:a', '32k', '-acodec', 'libmp3lame', '-f', 'mp3'],
+}
+
+# ffmpeg output options and file extension for each preprocessing encoding
+PREPROCESS_ENCODINGS = {
+    "flac": ("flac", ['-acodec', 'flac']),
+    "mp3": ("mp3", ['-b:a', '32k', '-acodec', 'libmp3lame']),
+    "opus": ("ogg", ['-b:a', '16k', '-acodec', 'libopus']),
+}
+
+def plan_preprocessing(input_file, output_file, policy="balanced", verbose=False):
+    # Returns (plan, file to upload, ffmpeg command or None). The file to upload
+    # is `output_file` with the extension of the chosen format, or `input_file`
+    # itself when it can be uploaded as is.
+    with span("probe"):
+        info = probe_audio(input_file)
+    plan = choose_preprocessing(info, policy)
+    if verbose:
+        if info is None:
+            print(f"Could not probe {input_file}")
+        else:
+            print(f"Probed {input_file}: {info['codec']} in {info['container']}, {info['sample_rate']} Hz, "
+                  f"{info['channels']} channel(s), {info['size']} bytes")
+        print(f"Preprocessing plan ({policy}): {plan}")
+    if plan == "copy":
+        return plan, input_file, None
+
+    base_name = os.path.splitext(output_file)[0]
+    if plan == "remux":
+        output_file = f"{base_name}.{REMUX_EXTENSIONS[info['codec']]}"
+        options = ['-map', '0:a:0', '-c:a', 'copy']
+    else:
+        extension, codec_options = PREPROCESS_ENCODINGS[plan]
+        output_file = f"{base_name}.{extension}"
+        options = ['-ar', '16000', '-ac', '1', '-map', '0:a:'] + codec_options
     # Remove the output file if it exists
     if os.path.exists(output_file):
         os.remove(output_file)
         if verbose:
             print(f"Removed existing output file: {output_file}")
+    return plan, output_file, ['ffmpeg', '-i', input_file] + options + [output_file]
+
+def preprocess_audio(input_file, output_file, verbose=False, policy="balanced"):
+    # Returns the file to upload; see plan_preprocessing. Callers must only
+    # delete it when it isn't `input_file`.
+    plan, output_file, command = plan_preprocessing(input_file, output_file, policy, verbose)
+    with span("preprocess", plan=plan) as preprocess_span:
+        if command is not None:
+            if verbose:
+                print(f"Running FFmpeg command: {' '.join(command)}")
+            subprocess.run(command, check=True)
+        preprocess_span.set(input_bytes=os.path.getsize(input_file), output_bytes=os.path.getsize(output_file))
+    return output_file
+
+def pcm_to_wav(pcm, rate=SAMPLE_RATE, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+def encode_command(encoding):
+    # ffmpeg command that encodes PCM from stdin to stdout; None for "wav"
+    if encoding not in UPLOAD_ENCODINGS:
+        raise ValueError(f"Unsupported upload encoding: {encoding}")
+    if UPLOAD_ENCODINGS[encoding] is None:
+        return None
+    return [
+        'ffmpeg',
+        '-loglevel', 'error',
+        '-f', 's16le',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        '-i', 'pipe:0',
+    ] + UPLOAD_ENCODINGS[encoding] + ['pipe:1']
+
+def encode_pcm(pcm, encoding="wav", verbose=False):
+    # Encode raw 16 kHz mono PCM for upload without touching the filesystem
+    if hasattr(pcm, "read"):
+        pcm = pcm.read()
+    command = encode_command(encoding)
+    if command is None:
+        with span("encode", encoding=encoding):
+            return pcm_to_wav(pcm), "audio.wav"
+    if verbose:
+        print(f"Running FFmpeg command: {' '.join(command)}")
+    with span("encode", encoding=encoding):
+        result = subprocess.run(command, input=bytes(pcm), stdout=subprocess.PIPE, check=True)
+    return result.stdout, f"audio.{encoding}"
+
+def transcribe_audio(file_path, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, client=None, filename="audio.wav"):
+    if client is None:
+        with TranscriptionClient(api_key) as client:
+            return client.transcribe(file_path, model, language, temperature, task, word_timestamps, initial_prompt, verbose, filename)
+    return client.transcribe(file_path, model, language, temperature, task, word_timestamps, initial_prompt, verbose, filename)
+
+def transcribe_pcm(pcm, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, client=None, encoding="wav", trim=False):
+    # With `trim`, silence is cut before encoding; timestamps then no longer
+    # match the original recording.
+    if hasattr(pcm, "read"):
+        pcm = pcm.read()
+    if trim:
+        with span("trim"):
+            trimmed = trim_silence(pcm)
+        if verbose:
+            print(f"Trimmed silence: {len(pcm)} -> {len(trimmed)} bytes")
+        if not trimmed:
+            return "" if not word_timestamps else {"text": "", "segments": []}
+        pcm = trimmed
+    audio, filename = encode_pcm(pcm, encoding, verbose)
+    if verbose:
+        print(f"Uploading {len(audio)} bytes of {encoding} audio from memory")
+    return transcribe_audio(audio, api_key, model, language, temperature, task, word_timestamps, initial_prompt, verbose, client, filename)
+
+def truncate_prompt(prompt, max_words, max_chars=MAX_PROMPT_CHARS):
+    # The longest run of at most `max_words` trailing words that fits in
+    # `max_chars` once joined by single spaces. Only the tail of `prompt` is
+    # split, growing the window until enough words are found, so the cost
+    # doesn't depend on the length of the document.
+    window = 2 * max_chars + 64
+    while True:
+        start = max(0, len(prompt) - window)
+        words = prompt[start:].split()
+        if start > 0 and words and not prompt[start - 1].isspace() and not prompt[start].isspace():
+            words = words[1:]  # Cut in the middle of a word
+        kept, length = [], -1
+        for word in reversed(words):
+            if len(kept) == max_words or length + 1 + len(word) > max_chars:
+                return ' '.join(reversed(kept))
+            kept.append(word)
+            length += 1 + len(word)
+        if start == 0:
+            return ' '.join(reversed(kept))
+        window *= 2
+
+def decode_audio(input_file, verbose=False):
+    # Decode any input to raw 16 kHz mono PCM in memory
+    info = probe_audio(input_file) if input_file.lower().endswith(".wav") else None
+    if info is not None and info["header_ok"] and (info["codec"], info["sample_rate"], info["channels"]) == ("pcm_s16le", SAMPLE_RATE, 1):
+        with span("decode"), wave.open(input_file, 'rb') as wf:
+            return wf.readframes(wf.getnframes())
     command = [
         'ffmpeg',
+        '-loglevel', 'error',
         '-i', input_file,
-        '-ar', '16000',
-        '-ac', '1',
         '-map', '0:a:',
-        '-b:a', '32k',  # Reduce bitrate to 32 kbps
-        '-acodec', 'libmp3lame',  # Use MP3 codec for good compression and compatibility
-        output_file
+        '-f', 's16le',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        'pipe:1'
     ]
     if verbose:
         print(f"Running FFmpeg command: {' '.join(command)}")
-    subprocess.run(command, check=True)
-
-def transcribe_audio(file_path, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False):
-    url = "https://api.groq.com/openai/v1/audio/transcriptions"
-    headers = {
-        "Authorization": f"bearer {api_key}"
-    }
-    data = {
-        "model": model,
-        "temperature": temperature,
-        "response_format": "verbose_json" if word_timestamps else "json"
-    }
-    if language:
-        data["language"] = language
-    if task == "translate":
-        data["task"] = "translate"
-    if initial_prompt:
-        data["prompt"] = initial_prompt
+    with span("decode"):
+        return subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+
+def find_split_points(pcm, chunk_length, search_window=30.0, vad_mode=3):
+    # Cut near every `chunk_length` seconds, in the middle of the longest run of
+    # non-speech frames found in the preceding `search_window` seconds (at most
+    # half a chunk, so chunks stay close to `chunk_length`). Of equally long
+    # pauses, the one closest to the target wins.
+    speech = speech_mask(pcm, vad_mode)
+    frame_count = len(speech)
+    frames_per_chunk = max(1, int(chunk_length * 1000 / VAD_FRAME_MS))
+    frames_per_window = max(1, min(int(search_window * 1000 / VAD_FRAME_MS), frames_per_chunk // 2))
+
+    split_points = []
+    start = 0
+    while frame_count - start > frames_per_chunk:
+        target = start + frames_per_chunk
+        best_frame, best_key, run = target, (0, 0), 0
+        for i in range(max(start + 1, target - frames_per_window), target):
+            run = 0 if speech[i] else run + 1
+            if run:
+                middle = i - run // 2
+                key = (run, -abs(target - middle))
+                if key > best_key:
+                    best_key = key
+                    best_frame = middle
+        split_points.append(best_frame * VAD_FRAME_BYTES)
+        start = best_frame
+    return split_points
+
+def merge_transcriptions(results, offsets, word_timestamps=False):
+    if not word_timestamps:
+        return " ".join(text.strip() for text in results if text.strip())
+
+    merged = {key: value for key, value in results[0].items() if key not in ("text", "segments", "words")}
+    merged["text"] = " ".join(result["text"].strip() for result in results if result["text"].strip())
+    merged["segments"] = []
+    merged["words"] = []
+    for result, offset in zip(results, offsets):
+        for segment in result.get("segments", []):
+            segment = dict(segment, id=len(merged["segments"]))
+            segment["start"] += offset
+            segment["end"] += offset
+            merged["segments"].append(segment)
+        for word in result.get("words", []):
+            merged["words"].append(dict(word, start=word["start"] + offset, end=word["end"] + offset))
+    if "duration" in merged:
+        merged["duration"] = offsets[-1] + results[-1].get("duration", 0)
+    return merged
 
+def transcribe_long_audio(pcm, api_key, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, client=None, chunk_length=600, chunk_jobs=4, chunk_context=False, encoding="mp3", limiter=None):
+    # `limiter` (a RateLimiter) is waited on before every chunk's request
+    boundaries = [0] + find_split_points(pcm, chunk_length) + [len(pcm)]
+    chunks = [pcm[start:end] for start, end in zip(boundaries, boundaries[1:])]
+    offsets = [start / (SAMPLE_RATE * SAMPLE_WIDTH) for start in boundaries[:-1]]
     if verbose:
-        print(f"Sending request to Groq API:")
-        print(f"  URL: {url}")
-        print(f"  Headers: {headers}")
-        print(f"  Data: {data}")
+        print(f"Split {len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH):.1f}s of audio into {len(chunks)} chunks at {[f'{o:.1f}' for o in offsets]}")
 
-    with open(file_path, "rb") as file:
-        files = {"file": file}
-        response = requests.post(url, headers=headers, data=data, files=files)
+    def transcribe_chunk(chunk, prompt):
+        if limiter is not None:
+            limiter.wait()
+        return transcribe_pcm(chunk, api_key, model, language, temperature, task, word_timestamps, prompt, verbose, client, encoding)
 
-    if response.status_code == 200:
-        if verbose:
-            print("Received successful response from Groq API")
-        result = response.json()
-        return result["text"] if not word_timestamps else result
+    if chunk_context:
+        # Each chunk waits for its predecessor so the prompt can carry its text
+        results = []
+        previous_text = ""
+        for chunk in chunks:
+            prompt = truncate_prompt(f"{initial_prompt or ''} {previous_text}", MAX_PROMPT_WORDS)
+            result = transcribe_chunk(chunk, prompt or None)
+            previous_text = result["text"] if word_timestamps else result
+            results.append(result)
     else:
-        if verbose:
-            print(f"Error response from Groq API: {response.status_code}")
-            print(f"Response content: {response.text}")
-        raise Exception(f"Error: {response.status_code}, {response.text}")
+        with ThreadPoolExecutor(max_workers=chunk_jobs) as pool:
+            results = list(pool.map(transcribe_chunk, chunks, [initial_prompt] * len(chunks)))
+
+    return merge_transcriptions(results, offsets, word_timestamps)
+
+class StreamingTranscriber:
+    # Uploads finalized speech segments in the background while recording
+    # continues; finish() returns the combined text in segment order.
+    def __init__(self, api_key, model, language=None, initial_prompt=None, verbose=False, client=None, encoding="wav", max_workers=2, trim=False):
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.initial_prompt = initial_prompt
+        self.verbose = verbose
+        self.client = client
+        self.encoding = encoding
+        self.trim = trim
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = []
+
+    def context_prompt(self):
+        # Prompt with the text of the segments that already came back, in order
+        texts = []
+        for future in self.futures:
+            if not future.done() or future.exception() is not None:
+                break
+            texts.append(future.result())
+        return truncate_prompt(f"{self.initial_prompt or ''} {' '.join(texts)}", MAX_PROMPT_WORDS) or None
 
-def record_audio_with_vad(output_file, verbose=False, silence_threshold=1.0, silence_duration=2.0, stop_recording_callback=None):
+    def submit(self, pcm):
+        if self.verbose:
+            print(f"Uploading segment {len(self.futures) + 1} ({len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH):.2f}s)")
+        self.futures.append(self.pool.submit(
+            transcribe_pcm,
+            pcm,
+            self.api_key,
+            self.model,
+            self.language,
+            initial_prompt=self.context_prompt(),
+            verbose=self.verbose,
+            client=self.client,
+            encoding=self.encoding,
+            trim=self.trim
+        ))
+
+    def finish(self):
+        try:
+            texts = [future.result() for future in self.futures]
+        finally:
+            self.pool.shutdown()
+        return " ".join(text.strip() for text in texts if text.strip())
+
+def record_capture_metrics(started_at, endpointer):
+    finished_at = time.perf_counter()
+    record("recording", finished_at - started_at)
+    if endpointer.last_speech_at is not None:
+        # Time spent waiting for the trailing silence after the last speech
+        record("vad_tail", finished_at - endpointer.last_speech_at)
+
+def record_audio_with_vad(output_file=None, verbose=False, silence_threshold=1.0, silence_duration=2.0, stop_recording_callback=None, source=None, on_segment=None, segment_silence=0.3, max_duration=None, max_bytes=None):
+    # With `on_segment`, every stretch of speech followed by `segment_silence`
+    # seconds of silence is handed over as soon as it is final, while the
+    # recording carries on until `silence_duration` of silence. The audio is
+    # written to `output_file` as it is captured, and the recording stops
+    # after `max_duration` seconds or `max_bytes` bytes of PCM at the latest.
     if verbose:
         print("Initializing audio recording...")
         print(f"Silence threshold: {silence_threshold}")
         print(f"Silence duration: {silence_duration}")
+        if output_file:
+            print(f"Saving the recording to {output_file}")
 
     CHUNK = 480  # 30ms at 16kHz
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 16000  # webrtcvad requires 8000, 16000, 32000, or 48000 Hz
-    vad = webrtcvad.Vad(3)  # Aggressiveness mode 3 (highest)
+    capture = CaptureBuffer(output_file, max_duration, max_bytes)
+    endpointer = SpeechEndpointer(silence_duration, on_segment, segment_silence, capture=capture)
 
-    p = pyaudio.PyAudio()
-    stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
+    # Without a source, open the default microphone just for this recording
+    owns_source = source is None
+    if owns_source:
+        source = PyAudioSource(CHUNK, keep_warm=False)
+    source.start()
+    started_at = time.perf_counter()
 
     print("Recording... (Speak now, recording will stop after prolonged silence)")
 
-    frames = []
-    silent_chunks = 0
-    voiced_frames = 0
-
     while True:
         if stop_recording_callback and stop_recording_callback():
             break
 
-        data = stream.read(CHUNK)
-        is_speech = vad.is_speech(data, RATE)
-        
-        if is_speech:
-            frames.append(data)
-            silent_chunks = 0
-            voiced_frames += 1
-        else:
-            frames.append(data)
-            silent_chunks += 1
-
-        if voiced_frames > 0 and silent_chunks > int(silence_duration * (RATE / CHUNK)):
+        data = source.read(CHUNK)
+        if len(data) < CHUNK * SAMPLE_WIDTH:
+            break  # End of a replayed recording
+        if endpointer.feed(data):
             break
 
     print("Recording finished.")
+    if capture.full and verbose:
+        print(f"Stopped at the recording limit ({capture.size / (SAMPLE_RATE * SAMPLE_WIDTH):.1f}s)")
+    record_capture_metrics(started_at, endpointer)
+    pcm = endpointer.finish()
 
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
+    source.stop()
+    if owns_source:
+        source.close()
 
-    if verbose:
-        print(f"Recording finished. Saving to {output_file}")
+    return pcm
 
-    # Write the recorded data to a WAV file
-    wf = wave.open(output_file, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(p.get_sample_size(FORMAT))
-    wf.setframerate(RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()
+OUTPUT_FORMATS = ("txt", "json") + tuple(SUBTITLE_WRITERS)
 
-def save_output(transcription, output_file, format, verbose=False):
+def output_paths(output_file, format):
+    # Files save_output writes for `output_file` in `format`
+    if not format:
+        return []
     base_name, _ = os.path.splitext(output_file)
+    formats = OUTPUT_FORMATS if format == 'all' else (format,)
+    return [f"{base_name}.{name}" for name in formats]
+
+def save_output(transcription, output_file, format, verbose=False, word_level=False, max_line_width=None):
+    # `transcription` is the plain text, or the verbose_json result whose
+    # segments (or words, with word_level) drive the subtitle timings
+    base_name, _ = os.path.splitext(output_file)
+    text = transcription if isinstance(transcription, str) else transcription.get("text", "")
     
     if verbose:
         print(f"Saving output in {format} format(s)")
@@ -135,56 +383,122 @@ def save_output(transcription, output_file, format, verbose=False):
         if verbose:
             print(f"Writing to {txt_file}")
         with open(txt_file, "w") as f:
-            f.write(transcription)
+            f.write(text)
     
     if format == 'json' or format == 'all':
         json_file = f"{base_name}.json"
         if verbose:
             print(f"Writing to {json_file}")
         with open(json_file, "w") as f:
-            json.dump({"text": transcription}, f, indent=2)
-    
-    if format == 'tsv' or format == 'all':
-        tsv_file = f"{base_name}.tsv"
-        if verbose:
-            print(f"Writing to {tsv_file}")
-        with open(tsv_file, "w", newline='') as f:
-            writer = csv.writer(f, delimiter='\t')
-            writer.writerow(["start", "end", "text"])
-            writer.writerow(["0.00", str(len(transcription) / 20), transcription])  # Rough estimate of duration
-    
-    if format in ['vtt', 'srt'] or format == 'all':
-        # Simple implementation for VTT and SRT (without proper timing)
-        content = f"1\n00:00:00.000 --> 00:00:{len(transcription)//20:02d}.000\n{transcription}\n"
-        
-        if format == 'vtt' or format == 'all':
-            vtt_file = f"{base_name}.vtt"
-            if verbose:
-                print(f"Writing to {vtt_file}")
-            with open(vtt_file, "w") as f:
-                f.write("WEBVTT\n\n" + content)
-        
-        if format == 'srt' or format == 'all':
-            srt_file = f"{base_name}.srt"
-            if verbose:
-                print(f"Writing to {srt_file}")
-            with open(srt_file, "w") as f:
-                f.write(content)
+            json.dump({"text": text} if isinstance(transcription, str) else transcription, f, indent=2)
+
+    subtitle_formats = [name for name in SUBTITLE_WRITERS if format == name or format == 'all']
+    if subtitle_formats:
+        with ExitStack() as stack:
+            writers = []
+            for name in subtitle_formats:
+                subtitle_file = f"{base_name}.{name}"
+                if verbose:
+                    print(f"Writing to {subtitle_file}")
+                writers.append(SUBTITLE_WRITERS[name](stack.enter_context(open(subtitle_file, "w", newline=''))))
+            write_subtitles(transcription, writers, word_level, max_line_width)
 
-def process_audio(audio_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, verbose=False):
+def upload_duration(path):
+    duration = audio_duration(path)
+    if duration is None:
+        duration = os.path.getsize(path) / PREPROCESSED_BYTES_PER_SECOND
+    return duration
+
+def preprocessed_file_path(audio_file, directory=None):
+    # Next to the input unless another `directory` is given
+    if directory is not None:
+        return os.path.join(directory, f"{os.path.splitext(os.path.basename(audio_file))[0]}_preprocessed.mp3")
+    return f"{os.path.splitext(audio_file)[0]}_preprocessed.mp3"
+
+def save_transcription(audio_file, transcription, output_dir, output_format, verbose=False, word_level=False, max_line_width=None):
+    # No `output_format` writes nothing, e.g. when results only go to a corpus
+    output_file = os.path.join(output_dir, os.path.basename(audio_file))
+    if not output_format:
+        return output_file
     if verbose:
-        print(f"\nProcessing {audio_file}...")
-    
-    # Preprocess audio
-    preprocessed_file = f"{os.path.splitext(audio_file)[0]}_preprocessed.mp3"
+        print(f"Saving output to: {output_file}")
+    with span("save"):
+        save_output(transcription, output_file, output_format, verbose, word_level, max_line_width)
+
     if verbose:
-        print(f"Preprocessing audio: {audio_file} -> {preprocessed_file}")
-    preprocess_audio(audio_file, preprocessed_file, verbose)
+        print(f"Transcription saved in {output_format} format(s) in {output_dir}")
+
+    return output_file
+
+def source_cache_key(cache, audio_file, model, language, temperature, task, word_timestamps, initial_prompt, audio_hash=None):
+    params = transcription_params(model, language, temperature, task, word_timestamps, initial_prompt)
+    return cache.key(audio_hash or hash_file(audio_file), params)
+
+def cached_source_transcription(cache, audio_file, model, language, temperature, task, word_timestamps, initial_prompt, verbose=False, audio_hash=None):
+    # Returns (source_key, transcription); transcription is None on a cache miss
+    source_key = source_cache_key(cache, audio_file, model, language, temperature, task, word_timestamps, initial_prompt, audio_hash)
+    transcription = cache.get_source(source_key)
+    if transcription is not None and verbose:
+        print(f"Cache hit for {audio_file}, skipping preprocessing")
+    return source_key, transcription
+
+def transcribe_file(preprocessed_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, verbose=False, client=None, cache=None, source_key=None, chunk_length=None, chunk_jobs=4, chunk_context=False, limiter=None):
+    # With a `limiter`, every API request (one per chunk) waits for its slot
+    transcription = None
+    if cache is not None:
+        params = transcription_params(model, language, temperature, task, word_timestamps, initial_prompt)
+        key = cache.key(hash_file(preprocessed_file), params)
+        transcription = cache.get(key)
+        if transcription is not None:
+            if verbose:
+                print(f"Cache hit for {preprocessed_file}, skipping upload")
+            if source_key:
+                cache.link_source(source_key, key)
 
     # Transcribe
-    if verbose:
-        print(f"Transcribing {preprocessed_file}...")
-    transcription = transcribe_audio(
+    if transcription is None:
+        if chunk_length and upload_duration(preprocessed_file) > chunk_length:
+            if verbose:
+                print(f"Transcribing {preprocessed_file} in chunks of about {chunk_length}s...")
+            transcription = transcribe_long_audio(
+                decode_audio(preprocessed_file, verbose),
+                api_key,
+                model,
+                language,
+                temperature,
+                task,
+                word_timestamps,
+                initial_prompt,
+                verbose,
+                client,
+                chunk_length,
+                chunk_jobs,
+                chunk_context,
+                limiter=limiter
+            )
+        else:
+            if verbose:
+                print(f"Transcribing {preprocessed_file}...")
+            if limiter is not None:
+                limiter.wait()
+            transcription = transcribe_audio(
+                preprocessed_file,
+                api_key,
+                model,
+                language,
+                temperature,
+                task,
+                word_timestamps,
+                initial_prompt,
+                verbose,
+                client
+            )
+        if cache is not None:
+            cache.put(key, transcription, source_key)
+    return transcription
+
+def transcribe_and_save(audio_file, preprocessed_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, verbose=False, client=None, cache=None, source_key=None, chunk_length=None, chunk_jobs=4, chunk_context=False, word_level=False, max_line_width=None):
+    transcription = transcribe_file(
         preprocessed_file,
         api_key,
         model,
@@ -193,21 +507,90 @@ def process_audio(audio_file, api_key, model, language, temperature, task, word_
         task,
         word_timestamps,
         initial_prompt,
-        verbose
+        verbose,
+        client,
+        cache,
+        source_key,
+        chunk_length,
+        chunk_jobs,
+        chunk_context
     )
+    return save_transcription(audio_file, transcription, output_dir, output_format, verbose, word_level, max_line_width)
 
-    # Save output
-    output_file = os.path.join(output_dir, os.path.basename(audio_file))
-    if verbose:
-        print(f"Saving output to: {output_file}")
-    save_output(transcription, output_file, output_format, verbose)
+def process_audio(audio_file, api_key, model, language, temperature, task, word_timestamps, initial_prompt, output_dir, output_format, verbose=False, client=None, output_name="recording", encoding="wav", cache=None, chunk_length=None, chunk_jobs=4, chunk_context=False, word_level=False, max_line_width=None, preprocess_policy="balanced", work_dir=None):
+    # Raw 16 kHz mono PCM (bytes or a buffer) is encoded and uploaded from memory
+    if not isinstance(audio_file, (str, os.PathLike)):
+        if verbose:
+            print(f"\nProcessing in-memory audio as {output_name}...")
+        transcription = transcribe_pcm(
+            audio_file,
+            api_key,
+            model,
+            language,
+            temperature,
+            task,
+            word_timestamps,
+            initial_prompt,
+            verbose,
+            client,
+            encoding
+        )
+        output_file = os.path.join(output_dir, output_name)
+        with span("save"):
+            save_output(transcription, output_file, output_format, verbose, word_level, max_line_width)
+        return output_file
 
     if verbose:
-        print(f"Transcription saved in {output_format} format(s) in {output_dir}")
+        print(f"\nProcessing {audio_file}...")
 
-    # Clean up preprocessed file
+    source_key = None
+    if cache is not None:
+        source_key, transcription = cached_source_transcription(
+            cache, audio_file, model, language, temperature, task, word_timestamps, initial_prompt, verbose
+        )
+        if transcription is not None:
+            return save_transcription(audio_file, transcription, output_dir, output_format, verbose, word_level, max_line_width)
+    
+    # Preprocess audio. With a `work_dir` each job gets a directory of its
+    # own there, so concurrent jobs on the same input don't share a file.
+    job_dir = None
+    if work_dir is not None:
+        job_dir = tempfile.mkdtemp(dir=work_dir)
+    preprocessed_file = preprocessed_file_path(audio_file, job_dir)
     if verbose:
-        print(f"Cleaning up temporary file: {preprocessed_file}")
-    os.remove(preprocessed_file)
+        print(f"Preprocessing audio: {audio_file} -> {preprocessed_file}")
+    try:
+        preprocessed_file = preprocess_audio(audio_file, preprocessed_file, verbose, preprocess_policy)
+
+        output_file = transcribe_and_save(
+            audio_file,
+            preprocessed_file,
+            api_key,
+            model,
+            language,
+            temperature,
+            task,
+            word_timestamps,
+            initial_prompt,
+            output_dir,
+            output_format,
+            verbose,
+            client,
+            cache,
+            source_key,
+            chunk_length,
+            chunk_jobs,
+            chunk_context,
+            word_level,
+            max_line_width
+        )
+    finally:
+        # Clean up preprocessed file, unless the input was uploaded as is
+        if preprocessed_file != audio_file and os.path.exists(preprocessed_file):
+            if verbose:
+                print(f"Cleaning up temporary file: {preprocessed_file}")
+            os.remove(preprocessed_file)
+        if job_dir is not None:
+            shutil.rmtree(job_dir, ignore_errors=True)
 
     return output_file
\ No newline at end of file
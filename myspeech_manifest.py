@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+
+from myspeech_cache import hash_file
+
+MANIFEST_NAME = "myspeech-manifest.jsonl"
+
+class BatchManifest:
+    # Append-only JSON lines log of a batch run: one line per finished file
+    # with its status, input fingerprint, request parameters, outputs and
+    # error. The last line for a file wins. With resume, the previous log is
+    # loaded (and compacted) so finished files can be skipped; without, new
+    # lines are appended to it.
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from an interrupted run
+                    self.entries[entry["audio_file"]] = entry
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(temp_path, path)
+        self.file = open(path, "a", buffering=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def is_done(self, audio_file, params):
+        # True when the file was transcribed with the same parameters, all of its
+        # outputs still exist and the input is unchanged. The input is only
+        # hashed when its size or modification time differ from the last run.
+        entry = self.entries.get(os.path.abspath(audio_file))
+        if entry is None or entry["status"] != "done" or entry["params"] != params:
+            return False
+        if not all(os.path.exists(path) for path in entry["output_files"]):
+            return False
+        try:
+            stat = os.stat(audio_file)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+            return True
+        return stat.st_size == entry["size"] and hash_file(audio_file) == entry["input_hash"]
+
+    def get(self, audio_file):
+        return self.entries.get(os.path.abspath(audio_file))
+
+    def record(self, audio_file, params, input_hash=None, output_files=(), error=None, elapsed=None):
+        try:
+            stat = os.stat(audio_file)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size = mtime_ns = None
+        entry = {
+            "audio_file": os.path.abspath(audio_file),
+            "status": "done" if error is None else "failed",
+            "input_hash": input_hash,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "params": params,
+            "output_files": list(output_files),
+            "error": None if error is None else str(error),
+            "elapsed": elapsed,
+            "time": time.time(),
+        }
+        line = json.dumps(entry)
+        with self.lock:
+            self.entries[entry["audio_file"]] = entry
+            self.file.write(line + "\n")
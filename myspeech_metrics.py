@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+
+# Optional timing instrumentation. Nothing is measured until a sink is
+# installed with set_sink(); a sink is any callable taking
+# (name, duration_seconds, attributes).
+_sink = None
+
+def set_sink(sink):
+    global _sink
+    _sink = sink
+
+def get_sink():
+    return _sink
+
+class _Span:
+    __slots__ = ("name", "attributes", "start")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **attributes):
+        # For attributes only known once the span is under way
+        self.attributes.update(attributes)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        sink = _sink
+        if sink is not None:
+            sink(self.name, time.perf_counter() - self.start, self.attributes)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def set(self, **attributes):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, **attributes):
+    if _sink is None:
+        return _NULL_SPAN
+    return _Span(name, attributes)
+
+def record(name, duration, **attributes):
+    sink = _sink
+    if sink is not None:
+        sink(name, duration, attributes)
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+        self.lock = threading.Lock()
+
+    def __call__(self, name, duration, attributes):
+        line = json.dumps({"time": time.time(), "span": name, "duration_ms": round(duration * 1000, 3), **attributes})
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        self.file.close()
+
+class PrometheusSink:
+    # Aggregates spans into a histogram and writes it in the Prometheus text
+    # format (e.g. for node_exporter's textfile collector), at most once per
+    # `interval` seconds and on close().
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stages = {}
+        self.last_write = 0.0
+
+    def __call__(self, name, duration, attributes):
+        with self.lock:
+            counts, total = self.stages.get(name, ([0] * (len(self.BUCKETS) + 1), 0.0))
+            for i, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.stages[name] = (counts, total + duration)
+            due = time.monotonic() - self.last_write >= self.interval
+        if due:
+            self.flush()
+
+    def render(self):
+        lines = [
+            "# HELP myspeech_stage_duration_seconds Time spent in each pipeline stage.",
+            "# TYPE myspeech_stage_duration_seconds histogram",
+        ]
+        with self.lock:
+            for name, (counts, total) in sorted(self.stages.items()):
+                for bound, count in zip(self.BUCKETS, counts):
+                    lines.append(f'myspeech_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'myspeech_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'myspeech_stage_duration_seconds_sum{{stage="{name}"}} {total}')
+                lines.append(f'myspeech_stage_duration_seconds_count{{stage="{name}"}} {counts[-1]}')
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        with self.write_lock:
+            content = self.render()
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(content)
+            os.replace(temp_path, self.path)
+            with self.lock:
+                self.last_write = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+class LatencyHistogram:
+    # Counts latencies in geometric buckets from `low` to `high` seconds, each
+    # `ratio` times wider than the last, so percentiles are accurate to that
+    # ratio at any scale. Once `window` samples are counted all counts are
+    # halved, so old samples fade out and percentiles follow changes.
+    def __init__(self, low=0.01, high=120.0, ratio=1.2, window=1000):
+        self.bounds = []
+        bound = low
+        while bound < high:
+            self.bounds.append(bound)
+            bound *= ratio
+        self.bounds.append(high)
+        self.window = window
+        self.counts = [0.0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, duration):
+        with self.lock:
+            index = next((i for i, bound in enumerate(self.bounds) if duration <= bound), len(self.bounds))
+            self.counts[index] += 1
+            self.total += 1
+            if self.total >= self.window:
+                self.counts = [count / 2 for count in self.counts]
+                self.total /= 2
+
+    @property
+    def count(self):
+        return self.total
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th percentile (0 < q < 100);
+        # None before any sample
+        with self.lock:
+            if not self.total:
+                return None
+            target = self.total * q / 100
+            seen = 0.0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+            return self.bounds[-1]
+
+METRICS_FORMATS = {
+    "jsonl": JsonLinesSink,
+    "prometheus": PrometheusSink,
+}
+
+def create_sink(path, format="jsonl"):
+    return METRICS_FORMATS[format](path)
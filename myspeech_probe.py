@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import wave
+
+from myspeech_audio import SAMPLE_RATE, SAMPLE_WIDTH
+
+# Largest file the transcription API accepts
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# File types the API decodes itself
+API_EXTENSIONS = {"flac", "mp3", "mp4", "mpeg", "mpga", "m4a", "ogg", "wav", "webm"}
+
+# Container to copy each codec into when the input's own container can't be uploaded
+REMUX_EXTENSIONS = {
+    "mp3": "mp3",
+    "flac": "flac",
+    "opus": "ogg",
+    "vorbis": "ogg",
+    "aac": "m4a",
+    "pcm_s16le": "wav",
+}
+
+# Above this rate, audio that could be uploaded as is gets re-encoded under
+# the balanced policy: it's what Whisper consumes, 16 kHz mono 16-bit PCM.
+PASSTHROUGH_MAX_BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+
+# Typical size of 16 kHz mono speech after FLAC compression
+FLAC_BYTES_PER_SECOND = 20000
+
+# speed:    upload what can be uploaded as is, else the cheapest encode (FLAC)
+# balanced: upload as is when no bigger than 16 kHz PCM, else 32 kbps MP3
+# size:     always encode to 16 kbps Opus, the smallest upload
+PREPROCESS_POLICIES = ("speed", "balanced", "size")
+
+def probe_wav(path):
+    with wave.open(path, 'rb') as wf:
+        rate, channels, width, frames = wf.getframerate(), wf.getnchannels(), wf.getsampwidth(), wf.getnframes()
+    size = os.path.getsize(path)
+    block = channels * width
+    # Streamed WAVs are written before their length is known and keep a
+    # placeholder (0 or 0xFFFFFFFF) in the header
+    header_ok = 0 < frames * block <= size
+    if not header_ok:
+        frames = max(0, size - 44) // block
+    return {
+        "container": "wav",
+        "codec": "pcm_u8" if width == 1 else f"pcm_s{8 * width}le",
+        "sample_rate": rate,
+        "channels": channels,
+        "duration": frames / rate if rate else None,
+        "bytes_per_second": rate * block,
+        "video": False,
+        "header_ok": header_ok,
+    }
+
+def probe_ffprobe(path):
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name,sample_rate,channels,bit_rate:stream_disposition=attached_pic:format=duration,bit_rate',
+        '-of', 'json',
+        path
+    ]
+    try:
+        info = json.loads(subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    streams = info.get("streams", [])
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    if audio is None:
+        return None
+    duration = float(info.get("format", {}).get("duration") or 0) or None
+    # Cover art shows up as a video stream but needs no stripping
+    video = any(
+        stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic")
+        for stream in streams
+    )
+    bit_rate = audio.get("bit_rate") or (None if video else info.get("format", {}).get("bit_rate"))
+    return {
+        "container": os.path.splitext(path)[1].lower().lstrip("."),
+        "codec": audio.get("codec_name"),
+        "sample_rate": int(audio.get("sample_rate") or 0) or None,
+        "channels": audio.get("channels"),
+        "duration": duration,
+        "bytes_per_second": int(bit_rate) / 8 if bit_rate else None,
+        "video": video,
+        "header_ok": True,
+    }
+
+def probe_audio(path):
+    # Describes the first audio stream of `path` (WAVs are read with the wave
+    # module, anything else with ffprobe), or returns None when it can't tell
+    info = None
+    if path.lower().endswith(".wav"):
+        try:
+            info = probe_wav(path)
+        except (wave.Error, EOFError):
+            pass  # Not PCM (e.g. float or WAVE_FORMAT_EXTENSIBLE); ask ffprobe
+    if info is None:
+        info = probe_ffprobe(path)
+    if info is not None:
+        info["size"] = os.path.getsize(path)
+    return info
+
+def choose_preprocessing(info, policy="balanced", max_upload_bytes=MAX_UPLOAD_BYTES):
+    # Returns "copy" (upload the input as is), "remux" (copy the audio stream
+    # into an uploadable container, which also repairs broken WAV headers) or
+    # the encoding to transcode to: "flac", "mp3" or "opus"
+    if policy not in PREPROCESS_POLICIES:
+        raise ValueError(f"Unknown preprocessing policy: {policy}")
+    if policy == "size":
+        return "opus"
+    if info is None:
+        return "mp3"
+
+    duration = info["duration"]
+    rate = info["bytes_per_second"] or (info["size"] / duration if duration else None)
+    if rate and duration and rate * duration <= max_upload_bytes and (policy == "speed" or rate <= PASSTHROUGH_MAX_BYTES_PER_SECOND):
+        if info["container"] in API_EXTENSIONS and info["header_ok"] and not info["video"] and info["size"] <= max_upload_bytes:
+            return "copy"
+        if info["codec"] in REMUX_EXTENSIONS:
+            return "remux"
+    if policy == "speed" and duration and duration * FLAC_BYTES_PER_SECOND <= max_upload_bytes:
+        return "flac"
+    return "mp3"
+
+def audio_duration(path):
+    info = probe_audio(path)
+    return info["duration"] if info is not None else None
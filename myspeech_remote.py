@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Thin client for myspeech_daemon. It only uses the standard library, so a
+# submission costs a Python startup and a socket round trip; the daemon
+# already holds the HTTP connections, the audio device and the cache.
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+DEFAULT_SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "myspeech.sock")
+
+class DaemonError(Exception):
+    pass
+
+class DaemonClient:
+    # Requests and events are single-line JSON objects. Each connection carries
+    # one request; the daemon streams events back and closes it when done.
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, op, **params):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            sock.close()
+            raise DaemonError(f"myspeech daemon is not running at {self.socket_path}") from e
+        with sock, sock.makefile("rwb") as stream:
+            stream.write(json.dumps({"op": op, **params}).encode() + b"\n")
+            stream.flush()
+            for line in stream:
+                yield json.loads(line)
+
+    def ping(self):
+        return next(self.request("ping"))
+
+    def transcribe(self, audio_files, **options):
+        # Paths are resolved here because the daemon has its own working directory
+        audio_files = [os.path.abspath(audio_file) for audio_file in audio_files]
+        if "output_dir" in options:
+            options["output_dir"] = os.path.abspath(options["output_dir"])
+        return self.request("transcribe", audio_files=audio_files, **options)
+
+    def record(self, **options):
+        if "output_dir" in options:
+            options["output_dir"] = os.path.abspath(options["output_dir"])
+        return self.request("record", **options)
+
+    def shutdown(self):
+        return next(self.request("shutdown"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit transcription jobs to a running myspeech daemon")
+    parser.add_argument("audio", nargs="*", help="audio file(s) to transcribe")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                        help=f"path of the daemon's Unix socket (default: {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--record", action="store_true", help="record from the daemon's microphone until silence is detected")
+    parser.add_argument("--model", help="name of the Whisper model to use (default: the daemon's)")
+    parser.add_argument("--language", help="language spoken in the audio")
+    parser.add_argument("--output_dir", "-o", default=".", help="directory to save the outputs")
+    parser.add_argument("--temperature", type=float, default=0, help="temperature to use for sampling")
+    parser.add_argument("--output_format", "-f", choices=["txt", "vtt", "srt", "tsv", "json", "all"], default="all",
+                        help="format of the output file (default: all)")
+    parser.add_argument("--task", choices=["transcribe", "translate"], default="transcribe",
+                        help="whether to perform transcription or translation")
+    parser.add_argument("--word_timestamps", action="store_true", help="extract word-level timestamps")
+    parser.add_argument("--max_line_width", type=int,
+                        help="maximum number of characters in a subtitle cue before it is split")
+    parser.add_argument("--word_level", action="store_true",
+                        help="build subtitle cues from word timings instead of segments (requires --word_timestamps)")
+    parser.add_argument("--initial_prompt", type=str, help="optional text to provide as a prompt for the first window")
+    parser.add_argument("--chunk_length", type=float,
+                        help="split audio longer than this many seconds at pauses and upload the chunks concurrently")
+    parser.add_argument("--chunk_jobs", type=int, default=4,
+                        help="number of chunks of one file to upload concurrently (default: 4)")
+    parser.add_argument("--chunk_context", action="store_true",
+                        help="prompt each chunk with the end of the previous chunk's text")
+    parser.add_argument("--ping", action="store_true", help="check that the daemon is running and exit")
+    parser.add_argument("--shutdown", action="store_true", help="stop the daemon after its queued jobs finish")
+    args = parser.parse_args()
+
+    client = DaemonClient(args.socket)
+    try:
+        if args.ping:
+            status = client.ping()
+            print(f"myspeech daemon running: {status['active']} active, {status['queued']} queued jobs")
+            return
+        if args.shutdown:
+            client.shutdown()
+            return
+        if not args.audio and not args.record:
+            parser.error("Either audio file(s) or --record must be specified")
+        if args.word_level and not args.word_timestamps:
+            parser.error("--word_level requires --word_timestamps")
+
+        options = {
+            "model": args.model,
+            "language": args.language,
+            "output_dir": args.output_dir,
+            "temperature": args.temperature,
+            "output_format": args.output_format,
+            "task": args.task,
+            "word_timestamps": args.word_timestamps,
+            "max_line_width": args.max_line_width,
+            "word_level": args.word_level,
+            "initial_prompt": args.initial_prompt,
+            "chunk_length": args.chunk_length,
+            "chunk_jobs": args.chunk_jobs,
+            "chunk_context": args.chunk_context,
+        }
+        options = {name: value for name, value in options.items() if value is not None}
+        events = client.record(**options) if args.record else client.transcribe(args.audio, **options)
+
+        failed = 0
+        for event in events:
+            if event["event"] == "done":
+                print(f"  OK    {event['audio_file']} -> {event['output_file']} ({event['elapsed']:.2f}s)")
+            elif event["event"] == "error":
+                failed += 1
+                print(f"  FAIL  {event.get('audio_file', '')}: {event['error']}")
+            elif event["event"] == "recording":
+                print("Recording...")
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
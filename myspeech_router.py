@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+
+from myspeech_client import TranscriptionClient, TranscriptionError, GROQ_API_BASE_URL
+
+# Statuses that say the request itself is bad; another endpoint would reject it too
+REQUEST_ERROR_STATUS_CODES = (400, 413, 415, 422)
+
+class Endpoint:
+    # One OpenAI-compatible /audio/transcriptions server. `models` maps the
+    # model names used on the command line to the server's own; None passes
+    # any model through unchanged, a dict restricts the endpoint to its keys.
+    def __init__(self, name, base_url, api_key, models=None, max_concurrency=4, connect_timeout=5.0, read_timeout=120.0):
+        self.name = name
+        self.models = models
+        self.max_concurrency = max_concurrency
+        # Failed requests are retried on the best endpoint, not on this one
+        self.client = TranscriptionClient(api_key, base_url, connect_timeout, read_timeout,
+                                          max_retries=0, pool_size=max_concurrency)
+        self.in_flight = 0
+        self.latency = None  # EWMA of successful request latency, in seconds
+        self.success = 1.0  # EWMA of the success rate
+        self.failures = 0  # Consecutive
+        self.ejections = 0  # Consecutive
+        self.ejected_until = 0.0
+        self.probing = False
+        self.requests = 0
+
+    def model_for(self, model):
+        return model if self.models is None else self.models.get(model)
+
+    def score(self, default_latency):
+        # Expected time to an answer; lower is better. Endpoints without a
+        # latency yet get the best one seen, so that they are tried early.
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + self.in_flight / self.max_concurrency) / max(self.success, 0.05)
+
+    def status(self):
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "success": round(self.success, 3),
+            "ejected_for": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+        }
+
+def load_endpoints(path, connect_timeout=5.0, read_timeout=120.0):
+    # Reads a JSON list of endpoints (or {"endpoints": [...]}), e.g.
+    #   [{"name": "groq", "base_url": "https://api.groq.com/openai/v1", "api_key_env": "GROQ_API_KEY",
+    #     "max_concurrency": 8},
+    #    {"name": "local", "base_url": "http://localhost:8000/v1", "api_key": "none",
+    #     "models": {"distil-whisper-large-v3-en": "distil-large-v3"}, "max_concurrency": 2}]
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, dict):
+        config = config["endpoints"]
+    endpoints = []
+    for i, entry in enumerate(config):
+        name = entry.get("name") or f"endpoint{i + 1}"
+        api_key = entry.get("api_key")
+        if api_key is None and entry.get("api_key_env"):
+            api_key = os.environ.get(entry["api_key_env"])
+            if not api_key:
+                raise ValueError(f"{entry['api_key_env']} environment variable is not set (endpoint {name})")
+        endpoints.append(Endpoint(
+            name,
+            entry.get("base_url", GROQ_API_BASE_URL),
+            api_key or "",
+            entry.get("models"),
+            entry.get("max_concurrency", 4),
+            connect_timeout,
+            read_timeout
+        ))
+    if not endpoints:
+        raise ValueError(f"No endpoints in {path}")
+    return endpoints
+
+class EndpointRouter:
+    # Spreads transcriptions over several endpoints; has the transcribe()
+    # signature of TranscriptionClient, so it can be passed as client=. Each
+    # request goes to the admitted endpoint with a free slot and the lowest
+    # score, from EWMAs (weight `alpha`) of latency and success. After
+    # `eject_after` consecutive failures, or a 429, an endpoint is ejected:
+    # for `eject_base` seconds (or the server's Retry-After), doubling with
+    # each ejection up to `eject_max`. Afterwards one probe request is let
+    # through and its success re-admits the endpoint. A failed request is
+    # retried on the next best endpoint, up to `max_attempts` in total (by
+    # default one per endpoint); once all have failed it backs off before
+    # going round again.
+    def __init__(self, endpoints, alpha=0.2, eject_after=3, eject_base=5.0, eject_max=60.0, max_attempts=None):
+        self.endpoints = list(endpoints)
+        self.alpha = alpha
+        self.eject_after = eject_after
+        self.eject_base = eject_base
+        self.eject_max = eject_max
+        self.max_attempts = max_attempts or len(self.endpoints)
+        self.pool_size = sum(endpoint.max_concurrency for endpoint in self.endpoints)
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    def status(self):
+        with self.condition:
+            return [endpoint.status() for endpoint in self.endpoints]
+
+    def acquire(self, model, tried):
+        # Reserves a slot on the best endpoint for `model`; waits while all of
+        # them are busy or ejected. None when no untried endpoint serves it.
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                candidates = [e for e in self.endpoints if e not in tried and e.model_for(model) is not None]
+                if not candidates:
+                    return None
+                admitted = [e for e in candidates if e.ejected_until <= now and not e.probing]
+                free = [e for e in admitted if e.in_flight < e.max_concurrency]
+                if free:
+                    # An endpoint back from ejection gets one probe right away,
+                    # even if others score better
+                    probes = [e for e in free if e.ejections]
+                    if probes:
+                        endpoint = probes[0]
+                        endpoint.probing = True
+                    else:
+                        known = [e.latency for e in self.endpoints if e.latency is not None]
+                        default_latency = min(known) if known else 0.0
+                        # Ties (e.g. before any latency is known) go to the least busy
+                        endpoint = min(free, key=lambda e: (e.score(default_latency), e.in_flight / e.max_concurrency))
+                    endpoint.in_flight += 1
+                    endpoint.requests += 1
+                    return endpoint
+                # Wake up when a slot frees (notify) or an ejection ends
+                ejected = [e.ejected_until for e in candidates if e.ejected_until > now]
+                self.condition.wait(min(ejected) - now if ejected else None)
+
+    def release(self, endpoint, latency=None, error=None):
+        # Frees the slot and records a success (`latency`) or a failure (`error`)
+        with self.condition:
+            endpoint.in_flight -= 1
+            endpoint.probing = False
+            if error is None and latency is not None:
+                endpoint.latency = latency if endpoint.latency is None else \
+                    (1 - self.alpha) * endpoint.latency + self.alpha * latency
+                endpoint.success = (1 - self.alpha) * endpoint.success + self.alpha
+                endpoint.failures = 0
+                endpoint.ejections = 0
+            elif error is not None:
+                endpoint.success = (1 - self.alpha) * endpoint.success
+                endpoint.failures += 1
+                retry_after = getattr(error, "retry_after", None)
+                rate_limited = getattr(error, "status_code", None) == 429
+                if rate_limited or endpoint.failures >= self.eject_after or endpoint.ejections:
+                    duration = min(self.eject_max, self.eject_base * 2 ** endpoint.ejections)
+                    if retry_after is not None:
+                        duration = min(self.eject_max, retry_after)
+                    endpoint.ejected_until = time.monotonic() + duration
+                    endpoint.ejections += 1
+                    endpoint.failures = 0
+            self.condition.notify_all()
+
+    def transcribe(self, audio, model, language=None, temperature=0, task="transcribe", word_timestamps=False, initial_prompt=None, verbose=False, filename="audio.wav"):
+        if hasattr(audio, "read"):
+            audio = audio.read()  # May be sent more than once
+        tried = set()
+        error = None
+        rounds = 0
+        for _ in range(self.max_attempts):
+            endpoint = self.acquire(model, tried)
+            if endpoint is None and tried:
+                # Every endpoint failed once; back off, then go round again
+                time.sleep(next(iter(tried)).client.backoff_delay(rounds))
+                rounds += 1
+                tried.clear()
+                endpoint = self.acquire(model, tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint)
+            start = time.perf_counter()
+            # The slot is freed however the request ends; a request error or an
+            # interrupt is recorded as neither a success nor a failure
+            latency = failure = None
+            try:
+                result = endpoint.client.transcribe(audio, endpoint.model_for(model), language, temperature, task,
+                                                    word_timestamps, initial_prompt, verbose, filename)
+                latency = time.perf_counter() - start
+                return result
+            except TranscriptionError as e:
+                if e.status_code in REQUEST_ERROR_STATUS_CODES:
+                    raise  # Says nothing about the endpoint
+                error = failure = e
+            except Exception as e:  # Connection errors, timeouts, malformed responses
+                error = failure = e
+            finally:
+                self.release(endpoint, latency, failure)
+            if verbose:
+                print(f"Endpoint {endpoint.name} failed ({error}), trying another one")
+        if error is None:
+            raise ValueError(f"No endpoint serves model {model}")
+        raise error
@@ -21,178 +21,50 @@ from Quartz import (
     kCGEventFlagMaskShift,
     kCGEventFlagMaskAlternate,
     kCGEventFlagMaskCommand,
-    CGEventCreateKeyboardEvent,
-    CGEventSetFlags,
-    CGEventPost
+    CGWindowListCopyWindowInfo,
+    kCGWindowListOptionOnScreenOnly,
+    kCGWindowListExcludeDesktopElements,
+    kCGNullWindowID
 )
 import threading
 import os
 import platform
-from myspeech_lib import record_audio_with_vad, process_audio
+from myspeech_lib import record_audio_with_vad, transcribe_pcm, truncate_prompt, StreamingTranscriber, UPLOAD_ENCODINGS, MAX_PROMPT_WORDS
+from myspeech_context import ContextSource, ContextProvider
+from myspeech_dictation import DictationBackend, DictationQueue, RECORDING_MARK, PROCESSING_MARK
+from myspeech_client import TranscriptionClient
+from myspeech_hedge import HedgedTranscriptionClient
+from myspeech_audio import PyAudioSource, RingBufferSource
+from myspeech_metrics import span, set_sink, create_sink, METRICS_FORMATS
+from myspeech_keyboard import MacOSKeyboardController
 import argparse
-import re
 import time
-from AppKit import NSPasteboard, NSStringPboardType, NSStatusBar, NSVariableStatusItemLength, NSMenu, NSMenuItem, NSApplication, NSApp
-import logging
-from contextlib import contextmanager
+from AppKit import NSPasteboard, NSStringPboardType, NSStatusBar, NSVariableStatusItemLength, NSMenu, NSMenuItem, NSApplication, NSApp, NSWorkspace
 # fix NameError: name 'NSObject' is not defined
 from Foundation import NSObject
 import objc
 
-PROCESSING_MARK = '[...]'
-RECORDING_MARK = '[REC]'
-
-class MacOSKeyboardController:
-    def __init__(self):
-        self.key_map = {
-            'a': 0x00, 'b': 0x0B, 'c': 0x08, 'd': 0x02, 'e': 0x0E, 'f': 0x03, 'g': 0x05,
-            'h': 0x04, 'i': 0x22, 'j': 0x26, 'k': 0x28, 'l': 0x25, 'm': 0x2E, 'n': 0x2D,
-            'o': 0x1F, 'p': 0x23, 'q': 0x0C, 'r': 0x0F, 's': 0x01, 't': 0x11, 'u': 0x20,
-            'v': 0x09, 'w': 0x0D, 'x': 0x07, 'y': 0x10, 'z': 0x06,
-            '1': 0x12, '2': 0x13, '3': 0x14, '4': 0x15, '5': 0x17, '6': 0x16, '7': 0x1A,
-            '8': 0x1C, '9': 0x19, '0': 0x1D,
-            '\n': 0x24, '\t': 0x30, ' ': 0x31, '-': 0x1B, '=': 0x18, '[': 0x21, ']': 0x1E,
-            '\\': 0x2A, ';': 0x29, "'": 0x27, ',': 0x2B, '.': 0x2F, '/': 0x2C,
-            'left': 0x7B, 'right': 0x7C, 'up': 0x7E, 'down': 0x7D,
-            'backspace': 0x33, 'delete': 0x75, 'cmd': 0x37, 'shift': 0x38, 'caps': 0x39,
-            'option': 0x3A, 'ctrl': 0x3B, 'esc': 0x35,
-            'f1': 0x7A, 'f2': 0x78, 'f3': 0x63, 'f4': 0x76,
-            'f5': 0x60, 'f6': 0x61, 'f7': 0x62, 'f8': 0x64,
-            'f9': 0x65, 'f10': 0x6D, 'f11': 0x67, 'f12': 0x6F,
-            'home': 0x73, 'end': 0x77, 'pageup': 0x74, 'pagedown': 0x79,
-            'return': 0x24, 'enter': 0x4C, 'tab': 0x30,
-            'space': 0x31, 'capslock': 0x39,
-            'numlock': 0x47, 'function': 0x3F,
-        }
-        self.modifier_keys = {
-            'cmd': 0x100000,
-            'command': 0x100000, # alias for cmd
-            'shift': 0x20000,
-            'option': 0x80000,
-            'ctrl': 0x40000,
-            'capslock': 0x10000,
-            'fn': 0x800000,
-        }
-        self.logger = logging.getLogger(__name__)
-
-    def press_key(self, key, modifiers=None):
-        try:
-            key_code = self.key_map.get(key.lower())
-            if key_code is not None:
-                event = CGEventCreateKeyboardEvent(None, key_code, True)
-                if modifiers:
-                    flags = 0
-                    for mod in modifiers:
-                        flags |= self.modifier_keys.get(mod.lower(), 0)
-                    CGEventSetFlags(event, flags)
-                else:
-                    # Ensure no modifiers are applied when not specified
-                    CGEventSetFlags(event, 0)
-                CGEventPost(kCGHIDEventTap, event)
-        except Exception as e:
-            self.logger.error(f"Error pressing key {key}: {str(e)}")
-
-    def release_key(self, key, modifiers=None):
-        try:
-            key_code = self.key_map.get(key.lower())
-            if key_code is not None:
-                event = CGEventCreateKeyboardEvent(None, key_code, False)
-                if modifiers:
-                    flags = 0
-                    for mod in modifiers:
-                        flags |= self.modifier_keys.get(mod.lower(), 0)
-                    CGEventSetFlags(event, flags)
-                CGEventPost(kCGHIDEventTap, event)
-        except Exception as e:
-            self.logger.error(f"Error releasing key {key}: {str(e)}")
-
-    def type_with_modifiers(self, key, modifiers):
-        self.press_key(key, modifiers)
-        time.sleep(0.01)
-        self.release_key(key, modifiers)
-
-    def type_special_char(self, char):
-        special_chars = {
-            '@': ('shift', '2'),
-            '#': ('shift', '3'),
-            '$': ('shift', '4'),
-            '%': ('shift', '5'),
-            '^': ('shift', '6'),
-            '&': ('shift', '7'),
-            '*': ('shift', '8'),
-            '(': ('shift', '9'),
-            ')': ('shift', '0'),
-            '_': ('shift', '-'),
-            '+': ('shift', '='),
-            '{': ('shift', '['),
-            '}': ('shift', ']'),
-            '|': ('shift', '\\'),
-            ':': ('shift', ';'),
-            '"': ('shift', "'"),
-            '<': ('shift', ','),
-            '>': ('shift', '.'),
-            '?': ('shift', '/'),
-            '~': ('shift', '`'),
-            '}': ('shift', ']'),
-            '{': ('shift', '[')
-        }
-        if char in special_chars:
-            self.type_with_modifiers(special_chars[char][1], [special_chars[char][0]])
-        else:
-            self.press_and_release(char)
-
-    def type_string(self, string):
-        for char in string:
-            # char without modifiers
-            if char.isalnum() or char in [' ', '\n', '\t', '.', ',', '!', '?', '-', '=', '[', ']', ';', '\'']:
-                if char.isupper():
-                    self.type_with_modifiers(char.lower(), ['shift'])
-                else:
-                    self.press_and_release(char)  # Ensure lowercase
-            else:
-                self.type_special_char(char)
-            # time.sleep(0.01)  # Small delay between keystrokes
-
-    def press_and_release(self, key, modifiers=None):
-        self.press_key(key, modifiers)
-        # time.sleep(0.01)
-        self.release_key(key, modifiers)
-
-    def key_combination(self, *keys):
-        modifiers = [key for key in keys if key in self.modifier_keys]
-        regular_keys = [key for key in keys if key not in self.modifier_keys]
-        for key in regular_keys:
-            self.press_key(key, modifiers)
-        for key in reversed(regular_keys):
-            self.release_key(key, modifiers)
-
-    @contextmanager
-    def hold_keys(self, *keys):
-        for key in keys:
-            self.press_key(key)
-        try:
-            yield
-        finally:
-            for key in reversed(keys):
-                self.release_key(key)
-
 # Initialize global variables
-recording = False
-stop_recording = False
-control_v_pressed = False
+dictations = None
 api_key = None
+client = None
+audio_source = None
 model = None
 initial_prompt = None
 verbose = False
 keyboard_controller = MacOSKeyboardController()  # Initialize at the top level
 delegate = None
-
-MAX_PROMPT_WORDS = 128
+metrics_sink = None
 
 key_state = {'control': False, 'v': False}
 last_shortcut_time = 0
 
 retrieve_context = False
+context_provider = None
+upload_format = "wav"
+streaming = False
+trim = True
+max_recording = None
 
 def update_status_title(title):
     delegate.performSelectorOnMainThread_withObject_waitUntilDone_(
@@ -200,7 +72,8 @@ def update_status_title(title):
     )
 
 def hotkey_callback(proxy, event_type, event, refcon):
-    global recording, stop_recording, last_shortcut_time
+    # Runs on the event tap; only hands the shortcut to the dictation queue
+    global last_shortcut_time
 
     key_code = CGEventGetIntegerValueField(event, kCGKeyboardEventKeycode)
     flags = CGEventGetFlags(event)
@@ -210,12 +83,8 @@ def hotkey_callback(proxy, event_type, event, refcon):
 
     if is_control_pressed and is_v_pressed:
         last_shortcut_time = time.time()
-        if not recording:
-            print("Control+V pressed. Starting recording...")
-            recording = True
-            stop_recording = False
-            threading.Thread(target=record_and_transcribe).start()
-            return None
+        dictations.toggle()
+        return None
 
     # Block events for some time after a shortcut detection
     if time.time() - last_shortcut_time < 0.3:
@@ -238,11 +107,6 @@ def _paste_text(text, verbose):
 def paste_text(text, verbose):
     _paste_text(text, verbose)
     
-def backspace_text(text):
-    global keyboard_controller
-    for _ in range(len(text)):
-        keyboard_controller.press_and_release('backspace')
-
 def get_active_text(max_retries=1):
     global keyboard_controller, verbose
 
@@ -294,96 +158,128 @@ def get_active_text(max_retries=1):
         # Restore the original clipboard content
         copy_to_clipboard(original_clipboard_content)
 
-def truncate_prompt(prompt, max_words, max_chars=896):
-    words = re.findall(r'\S+', prompt)
-    truncated = ' '.join(words[-max_words:])
-    if len(truncated) > max_chars:
-        while len(truncated) > max_chars and words:
-            words = words[1:]
-            truncated = ' '.join(words)
-    return truncated
-
-def record_and_transcribe():
-    global recording, stop_recording, verbose, retrieve_context, keyboard_controller
-    
-    original_clipboard_content = paste_from_clipboard()
-
-    try:
-        active_text = get_active_text() if retrieve_context else ""
-        keyboard_controller.type_string(RECORDING_MARK)
-        update_status_title("🔴")  # Update status bar icon when recording starts
-
-        the_random = os.urandom(8).hex()
-        temp_audio_file = f"/tmp/audio_recording_{the_random}.wav"
-        temp_text_file = f"/tmp/audio_recording_{the_random}.txt"
-
-        if os.path.exists(temp_audio_file):
-            os.remove(temp_audio_file)
-        
-        record_audio_with_vad(
-            temp_audio_file,
-            verbose=verbose, 
-            silence_threshold=1.0, 
+class MacOSContextSource(ContextSource):
+    def focus(self):
+        # The frontmost application's pid and its frontmost window's number;
+        # neither needs the screen recording permission that titles do
+        app = NSWorkspace.sharedWorkspace().frontmostApplication()
+        if app is None:
+            return None
+        pid = app.processIdentifier()
+        windows = CGWindowListCopyWindowInfo(
+            kCGWindowListOptionOnScreenOnly | kCGWindowListExcludeDesktopElements, kCGNullWindowID
+        ) or []
+        for window in windows:  # Front to back
+            if window.get("kCGWindowOwnerPID") == pid and window.get("kCGWindowLayer") == 0:
+                return pid, window.get("kCGWindowNumber")
+        return pid, None
+
+    def capture(self):
+        # Marks of dictations still in progress are not context
+        return get_active_text().split(PROCESSING_MARK)[0].split(RECORDING_MARK)[0]
+
+class MacOSDictationBackend(DictationBackend):
+    def __init__(self):
+        self.original_clipboard_content = None
+        self.restore_timer = None
+
+    def requested(self, dictation):
+        # Everything said from here on (plus the pre-roll) ends up in the recording
+        audio_source.mark()
+
+    def prepare(self, dictation):
+        # Restored once every pending dictation has been pasted
+        if self.restore_timer is not None:
+            self.restore_timer.cancel()
+            self.restore_timer = None
+        if self.original_clipboard_content is None:
+            self.original_clipboard_content = paste_from_clipboard()
+        dictation.window, active_text = None, ""
+        if retrieve_context:
+            with span("context"):
+                dictation.window, active_text = context_provider.lookup()
+            if verbose:
+                print(f"Active text: {active_text}")
+        combined_prompt = f"{initial_prompt or ''} {active_text}"
+        return truncate_prompt(combined_prompt, MAX_PROMPT_WORDS)
+
+    def record(self, dictation):
+        # Upload each pause-delimited segment while the user keeps talking.
+        # The segments need the prompt, which is read on the UI thread.
+        dictation.transcriber = None
+
+        def submit_segment(pcm):
+            if dictation.transcriber is None:
+                dictation.transcriber = StreamingTranscriber(
+                    api_key,
+                    model,
+                    initial_prompt=dictation.prompt.result() or None,
+                    verbose=verbose,
+                    client=client,
+                    encoding=upload_format,
+                    trim=trim
+                )
+            dictation.transcriber.submit(pcm)
+
+        # Keep the utterance in memory: no WAV, MP3 or TXT round-trip through /tmp
+        return record_audio_with_vad(
+            verbose=verbose,
+            silence_threshold=1.0,
             silence_duration=1.0,
-            stop_recording_callback=lambda: stop_recording
+            stop_recording_callback=dictation.stop_event.is_set,
+            source=audio_source,
+            on_segment=submit_segment if streaming else None,
+            max_duration=max_recording
         )
-        
-        active_text = active_text.split(PROCESSING_MARK)[0]
 
+    def transcribe(self, dictation, pcm):
+        if dictation.transcriber is not None:
+            text = dictation.transcriber.finish()
+        else:
+            text = transcribe_pcm(
+                pcm,
+                api_key,
+                model=model,
+                initial_prompt=dictation.prompt.result() or None,
+                verbose=verbose,
+                client=client,
+                encoding=upload_format,
+                trim=trim
+            )
         if verbose:
-            print(f"Active text: {active_text}")
-        
-        combined_prompt = initial_prompt or ""
-        if retrieve_context:
-            combined_prompt += f" {active_text}"
-        
-        truncated_prompt = truncate_prompt(combined_prompt, MAX_PROMPT_WORDS)
-
-        backspace_text(RECORDING_MARK)
-        keyboard_controller.type_string(PROCESSING_MARK)
-        update_status_title("⏳")  # Update status bar icon when recording starts
-        
-        process_audio(
-            temp_audio_file,
-            api_key,
-            model=model,
-            language=None,
-            temperature=0,
-            task="transcribe",
-            word_timestamps=False,
-            initial_prompt=truncated_prompt,
-            output_dir="/tmp",
-            output_format="txt",
-            verbose=verbose
-        )
-        
-        with open(temp_text_file, "r") as f:
-            text = f.read()
-        
-        if verbose:
-            print("Transcription:")
+            print(f"Transcription {dictation.number}:")
             print(text)
             print()
+        return text
 
-        backspace_text(PROCESSING_MARK)
-        paste_text(text, verbose)
-
-        # Clean up temporary files
-        os.remove(temp_audio_file)
-        os.remove(temp_text_file)
+    def show(self, old, new):
+        with span("mark"):
+            keyboard_controller.replace_text(old, new)
+        # Status bar icon: recording, waiting for a transcription, or idle
+        update_status_title("🔴" if RECORDING_MARK in new else "⏳" if new else "🎙")
 
-    except Exception as e:
-        print(f"Error: {e}")
-        print("Failed to record and transcribe.")
-        paste_text("")
-
-    finally:
-        recording = False
-        update_status_title("🎙")  # Update status bar icon when recording stops
+    def paste(self, dictation, text):
+        with span("paste"):
+            paste_text(text, verbose)
+        if retrieve_context:
+            context_provider.append(dictation.window, text)
+
+    def idle(self):
+        # Give the target application time to read the pasteboard without
+        # holding up the UI thread; the restore runs back on it
+        timer = threading.Timer(0.5, lambda: dictations.post(self.restore, timer))
+        timer.daemon = True
+        self.restore_timer = timer
+        timer.start()
+
+    def restore(self, timer):
+        if timer is not self.restore_timer:
+            return  # A new dictation started; restored after it is pasted
+        self.restore_timer = None
         if verbose:
-            print(f"Restoring original clipboard content: {original_clipboard_content}")
-        time.sleep(0.5)
-        copy_to_clipboard(original_clipboard_content)
+            print(f"Restoring original clipboard content: {self.original_clipboard_content}")
+        copy_to_clipboard(self.original_clipboard_content)
+        self.original_clipboard_content = None
 
 def copy_to_clipboard(text):
     pasteboard = NSPasteboard.generalPasteboard()
@@ -410,6 +306,19 @@ class AppDelegate(NSObject):
     def setStatusTitle_(self, title):
         self.statusItem.setTitle_(title)
 
+    def applicationWillTerminate_(self, notification):
+        # Quit from the menu exits without returning from app.run()
+        close_metrics()
+
+def close_metrics():
+    # Flushes the spans a sink is still holding back (Prometheus writes at
+    # most once a second)
+    global metrics_sink
+    if metrics_sink is not None:
+        set_sink(None)
+        metrics_sink.close()
+        metrics_sink = None
+
 def event_listener():
     event_mask = (
         CGEventMaskBit(kCGEventKeyDown) |
@@ -435,23 +344,73 @@ def event_listener():
     CFRunLoopRun()
 
 def main():
-    global model, initial_prompt, verbose, keyboard_controller, api_key, retrieve_context, delegate
+    global model, initial_prompt, verbose, keyboard_controller, api_key, client, audio_source, retrieve_context, context_provider, upload_format, streaming, trim, delegate, dictations, max_recording, metrics_sink
     parser = argparse.ArgumentParser(description="Whisper Groq Service")
     parser.add_argument("--model", default="distil-whisper-large-v3-en", help="Name of the model to use")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
     parser.add_argument("--initial-prompt", type=str, help="Initial prompt to include in transcription")
     parser.add_argument("--retrieve-context", action="store_true", help="Retrieve context from active text box")
+    parser.add_argument("--context-max-age", type=float, default=30.0,
+                        help="Seconds a window's retrieved context is reused before it is read again (0 to read it on every dictation)")
+    parser.add_argument("--upload-format", choices=sorted(UPLOAD_ENCODINGS), default="wav",
+                        help="Encoding used to upload recordings; wav is encoded in-process, flac and mp3 are piped through ffmpeg")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Transcribe each phrase while still recording, so the text is ready as soon as you stop speaking")
+    parser.add_argument("--keep-silence", action="store_true",
+                        help="Upload recordings as captured instead of trimming silence first")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate request when the API is slower than usual and use whichever answers first")
+    parser.add_argument("--hedge-delay", type=float,
+                        help="Seconds to wait before hedging (default: the 95th percentile of recent latencies)")
+    parser.add_argument("--hedge-model", help="Model for the duplicate request, e.g. a faster one (default: --model)")
+    parser.add_argument("--deadline", type=float,
+                        help="Give up on a transcription after this many seconds and paste nothing")
+    parser.add_argument("--metrics", help="Write per-stage timings to this file")
+    parser.add_argument("--metrics-format", choices=sorted(METRICS_FORMATS), default="jsonl",
+                        help="Format of the --metrics file: one JSON line per span, or a Prometheus text histogram")
+    parser.add_argument("--max-pending", type=int, default=4,
+                        help="Number of dictations that can be in progress at once; a new one can be recorded while earlier ones upload")
+    parser.add_argument("--keystroke-typing", action="store_true",
+                        help="Type the marks one keystroke at a time, for applications that ignore unicode string events")
+    parser.add_argument("--pre-roll", type=int, default=300,
+                        help="Milliseconds of audio captured before the shortcut to include in each recording (0 to disable)")
+    parser.add_argument("--max-recording", type=float,
+                        help="Stop a dictation after this many seconds even if you are still speaking")
     args = parser.parse_args()
 
     api_key = os.environ.get("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY environment variable is not set")
 
+    if args.metrics:
+        metrics_sink = create_sink(args.metrics, args.metrics_format)
+        set_sink(metrics_sink)
+
+    # Reuse one keep-alive connection to Groq across dictations
+    client = TranscriptionClient(api_key)
+    if args.hedge or args.deadline:
+        client = HedgedTranscriptionClient(
+            client,
+            hedge_delay=args.hedge_delay,
+            fallback_model=args.hedge_model,
+            deadline=args.deadline,
+            hedge=args.hedge
+        )
+    # Keep the microphone open between dictations
+    audio_source = PyAudioSource(keep_warm=True)
+    if args.pre_roll > 0:
+        audio_source = RingBufferSource(audio_source, preroll=args.pre_roll / 1000)
     verbose = args.verbose
     model = args.model
     initial_prompt = args.initial_prompt
     retrieve_context = args.retrieve_context
-    keyboard_controller = MacOSKeyboardController()
+    context_provider = ContextProvider(MacOSContextSource(), max_age=args.context_max_age)
+    upload_format = args.upload_format
+    streaming = args.streaming
+    trim = not args.keep_silence
+    max_recording = args.max_recording
+    keyboard_controller = MacOSKeyboardController(batch=not args.keystroke_typing)
+    dictations = DictationQueue(MacOSDictationBackend(), workers=args.max_pending, max_pending=args.max_pending)
 
     # Initialize the app and delegate
     app = NSApplication.sharedApplication()
@@ -465,7 +424,10 @@ def main():
     threading.Thread(target=event_listener, daemon=True).start()
 
     # Run the app
-    app.run()
+    try:
+        app.run()
+    finally:
+        close_metrics()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+import csv
+
+# Used when a transcription comes back as plain text without timings
+CHARACTERS_PER_SECOND = 20
+
+def format_timestamp(seconds, decimal_marker="."):
+    milliseconds = max(0, int(round(seconds * 1000)))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{decimal_marker}{milliseconds:03d}"
+
+def split_line(text, max_line_width):
+    lines = []
+    current = ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > max_line_width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+def _segment_cues(segment, max_line_width):
+    text = segment["text"].strip()
+    if not text:
+        return
+    start, end = segment["start"], segment["end"]
+    if not max_line_width or len(text) <= max_line_width:
+        yield start, end, text
+        return
+    # Share the segment's time between its lines in proportion to their length
+    lines = split_line(text, max_line_width)
+    total = sum(len(line) + 1 for line in lines)
+    duration = end - start
+    for line in lines:
+        line_end = start + duration * (len(line) + 1) / total
+        yield start, line_end, line
+        start = line_end
+
+def _word_cues(words, max_line_width):
+    if not max_line_width:
+        for word in words:
+            if word["word"].strip():
+                yield word["start"], word["end"], word["word"].strip()
+        return
+    start = end = None
+    current = ""
+    for word in words:
+        text = word["word"].strip()
+        if not text:
+            continue
+        if current and len(current) + 1 + len(text) > max_line_width:
+            yield start, end, current
+            current = ""
+        if not current:
+            start = word["start"]
+        current = f"{current} {text}" if current else text
+        end = word["end"]
+    if current:
+        yield start, end, current
+
+def iter_cues(transcription, word_level=False, max_line_width=None):
+    # Yields (start, end, text) from a plain-text or verbose_json transcription
+    if isinstance(transcription, str):
+        text = transcription.strip()
+        if text:
+            yield 0.0, len(text) / CHARACTERS_PER_SECOND, text
+        return
+    if word_level and transcription.get("words"):
+        yield from _word_cues(transcription["words"], max_line_width)
+        return
+    segments = transcription.get("segments")
+    if not segments:
+        yield from iter_cues(transcription.get("text", ""))
+        return
+    for segment in segments:
+        yield from _segment_cues(segment, max_line_width)
+
+class SrtWriter:
+    extension = "srt"
+
+    def __init__(self, file):
+        self.file = file
+        self.index = 0
+
+    def write_cue(self, start, end, text):
+        self.index += 1
+        self.file.write(f"{self.index}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n{text}\n\n")
+
+class VttWriter:
+    extension = "vtt"
+
+    def __init__(self, file):
+        self.file = file
+        self.file.write("WEBVTT\n\n")
+
+    def write_cue(self, start, end, text):
+        self.file.write(f"{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n")
+
+class TsvWriter:
+    extension = "tsv"
+
+    def __init__(self, file):
+        self.writer = csv.writer(file, delimiter='\t')
+        self.writer.writerow(["start", "end", "text"])
+
+    def write_cue(self, start, end, text):
+        self.writer.writerow([f"{start:.3f}", f"{end:.3f}", text])
+
+SUBTITLE_WRITERS = {writer.extension: writer for writer in (SrtWriter, VttWriter, TsvWriter)}
+
+def write_subtitles(transcription, writers, word_level=False, max_line_width=None):
+    # One pass over the cues feeds every requested format
+    for start, end, text in iter_cues(transcription, word_level, max_line_width):
+        for writer in writers:
+            writer.write_cue(start, end, text)
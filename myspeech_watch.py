@@ -0,0 +1,260 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from myspeech_batch import run_batch
+from myspeech_client import TranscriptionClient
+from myspeech_cache import TranscriptionCache, DEFAULT_CACHE_PATH
+from myspeech_manifest import BatchManifest, MANIFEST_NAME
+from myspeech_corpus import open_corpus
+from myspeech_probe import PREPROCESS_POLICIES
+
+AUDIO_EXTENSIONS = {
+    ".aac", ".flac", ".m4a", ".mka", ".mkv", ".mov", ".mp3", ".mp4",
+    ".mpeg", ".mpga", ".ogg", ".opus", ".wav", ".webm", ".wma",
+}
+
+class DirectoryWatcher:
+    # Yields audio files in `directory` once they are fully written: files
+    # that already exist, then new ones as they appear. A file is only handed
+    # out after its size and modification time have stayed the same for
+    # `settle` seconds, so partial copies are never picked up.
+    def __init__(self, directory, settle=2.0, extensions=AUDIO_EXTENSIONS):
+        self.directory = directory
+        self.settle = settle
+        self.extensions = extensions
+        self.candidates = {}  # path -> (stat signature, time it is due)
+
+    def is_audio(self, name):
+        return not name.startswith(".") and os.path.splitext(name)[1].lower() in self.extensions
+
+    @staticmethod
+    def signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def note(self, path):
+        # (Re)start the settle timer of a file that was created or changed
+        signature = self.signature(path)
+        if signature is not None:
+            self.candidates[path] = (signature, time.monotonic() + self.settle)
+
+    def scan(self):
+        with os.scandir(self.directory) as entries:
+            return [entry.path for entry in entries if entry.is_file() and self.is_audio(entry.name)]
+
+    def wait(self, timeout):
+        # Blocks until something may have changed, or for at most `timeout`
+        # seconds (None: indefinitely), noting changed files
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        for path in self.scan():
+            self.note(path)
+        while True:
+            now = time.monotonic()
+            for path, (signature, due) in list(self.candidates.items()):
+                if due > now:
+                    continue
+                current = self.signature(path)
+                if current is None:
+                    del self.candidates[path]  # Deleted or moved away
+                elif current != signature:
+                    self.note(path)  # Still being written
+                else:
+                    del self.candidates[path]
+                    yield path
+            timeout = None
+            if self.candidates:
+                timeout = max(0.0, min(due for _, due in self.candidates.values()) - time.monotonic())
+            self.wait(timeout)
+
+class InotifyWatcher(DirectoryWatcher):
+    # Sleeps in select() until the kernel reports a closed or moved-in file,
+    # so an idle watch uses no CPU.
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, directory, settle=2.0, extensions=AUDIO_EXTENSIONS):
+        super().__init__(directory, settle, extensions)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Cannot watch {directory}")
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were dropped; look at everything again
+                for path in self.scan():
+                    self.note(path)
+            elif name and self.is_audio(name):
+                self.note(os.path.join(self.directory, name))
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher(DirectoryWatcher):
+    # Rescans the directory every `interval` seconds; for platforms without
+    # inotify and network file systems that don't deliver its events.
+    def __init__(self, directory, settle=2.0, extensions=AUDIO_EXTENSIONS, interval=2.0):
+        super().__init__(directory, settle, extensions)
+        self.interval = interval
+        self.seen = {}
+
+    def note(self, path):
+        super().note(path)
+        self.seen[path] = self.signature(path)
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        for path in self.scan():
+            if self.signature(path) != self.seen.get(path):
+                self.note(path)
+
+def create_watcher(directory, settle=2.0, polling=False, poll_interval=2.0):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, settle)
+        except (OSError, AttributeError):
+            pass  # No inotify (e.g. out of watches); fall back to polling
+    return PollingWatcher(directory, settle, interval=poll_interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="myspeech watch",
+                                     description="Transcribe audio files as they are dropped into a directory")
+    parser.add_argument("directory", help="directory to watch")
+    parser.add_argument("--model", default="distil-whisper-large-v3-en", help="name of the Whisper model to use")
+    parser.add_argument("--language", help="language spoken in the audio")
+    parser.add_argument("--output_dir", "-o", help="directory to save the outputs (default: the watched directory)")
+    parser.add_argument("--temperature", type=float, default=0, help="temperature to use for sampling")
+    parser.add_argument("--output_format", "-f", choices=["txt", "vtt", "srt", "tsv", "json", "all"],
+                        help="format of the output file (default: all, or none with --corpus)")
+    parser.add_argument("--task", choices=["transcribe", "translate"], default="transcribe",
+                        help="whether to perform transcription or translation")
+    parser.add_argument("--word_timestamps", action="store_true", help="extract word-level timestamps")
+    parser.add_argument("--initial_prompt", type=str, help="optional text to provide as a prompt for the first window")
+    parser.add_argument("--jobs", "-j", type=int, default=2,
+                        help="number of files to transcribe concurrently (default: 2)")
+    parser.add_argument("--preprocess_policy", choices=PREPROCESS_POLICIES, default="balanced",
+                        help="how inputs are prepared for upload (default: balanced)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a file must stay unchanged before it is transcribed (default: 2)")
+    parser.add_argument("--polling", action="store_true", help="rescan the directory instead of using inotify")
+    parser.add_argument("--poll_interval", type=float, default=2.0,
+                        help="seconds between rescans when polling (default: 2)")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse transcriptions of unchanged audio from the on-disk cache")
+    parser.add_argument("--cache_path", default=DEFAULT_CACHE_PATH,
+                        help=f"location of the transcription cache (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--corpus", help="add every transcription to this corpus (SQLite, or JSON lines if .jsonl)")
+    parser.add_argument("--verbose", action="store_true", help="print out progress and debug messages")
+    args = parser.parse_args(argv)
+    if args.output_format is None and not args.corpus:
+        args.output_format = "all"
+
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY environment variable is not set")
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    output_dir = args.output_dir or args.directory
+    os.makedirs(output_dir, exist_ok=True)
+    cache = TranscriptionCache(args.cache_path) if args.cache else None
+    # Files trickle in, so each transcription is committed as it is added
+    corpus = open_corpus(args.corpus, flush_interval=0) if args.corpus else None
+    # The manifest remembers what was already transcribed across restarts
+    manifest = BatchManifest(os.path.join(output_dir, MANIFEST_NAME), resume=True)
+
+    def transcribe(path):
+        result = run_batch(
+            [path],
+            api_key,
+            args.model,
+            args.language,
+            args.temperature,
+            args.task,
+            args.word_timestamps,
+            args.initial_prompt,
+            output_dir,
+            args.output_format,
+            preprocess_jobs=1,
+            verbose=args.verbose,
+            client=client,
+            cache=cache,
+            manifest=manifest,
+            preprocess_policy=args.preprocess_policy,
+            corpus=corpus
+        )[0]
+        if result["error"] is not None:
+            print(f"  FAIL  {path}: {result['error']}", flush=True)
+        elif not result["skipped"]:
+            print(f"  OK    {path} -> {result['output_file']} ({result['elapsed']:.2f}s)", flush=True)
+
+    with TranscriptionClient(api_key, pool_size=args.jobs) as client, \
+            ThreadPoolExecutor(max_workers=args.jobs) as pool, \
+            create_watcher(args.directory, args.settle, args.polling, args.poll_interval) as watcher:
+        print(f"Watching {args.directory} ({type(watcher).__name__})", flush=True)
+        futures = []
+        # At most one file waiting per worker; while they are all taken the
+        # watcher stops reading events, and the files stay on disk until then
+        slots = threading.BoundedSemaphore(args.jobs * 2)
+        try:
+            for path in watcher:
+                slots.acquire()
+                futures = [future for future in futures if not future.done()]
+                future = pool.submit(transcribe, path)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+        except KeyboardInterrupt:
+            # Finish the files in progress but drop the queued ones
+            for future in futures:
+                future.cancel()
+    manifest.close()
+    if corpus is not None:
+        corpus.close()
+    if cache is not None:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ setup(
     name='myspeech',  # Updated package name
     version='0.1',
     packages=find_packages(),
-    py_modules=['myspeech', 'myspeech_lib', 'myspeech_service'],  # Updated module names
+    py_modules=['myspeech', 'myspeech_lib', 'myspeech_service', 'myspeech_batch', 'myspeech_client', 'myspeech_cache', 'myspeech_audio', 'myspeech_metrics', 'myspeech_subtitles', 'myspeech_daemon', 'myspeech_remote', 'myspeech_async', 'myspeech_manifest', 'myspeech_probe', 'myspeech_watch', 'myspeech_keyboard', 'myspeech_context', 'myspeech_dictation', 'myspeech_hedge', 'myspeech_router', 'myspeech_corpus'],  # Updated module names
     install_requires=[
         'requests',
         'pyaudio',
@@ -13,10 +13,15 @@ setup(
         'pyperclip',
         'pynput',
     ],
+    extras_require={
+        'async': ['httpx'],
+    },
     entry_points={
         'console_scripts': [
             'myspeech=myspeech:main',  # Updated entry point
             'myspeech_service=myspeech_service:main',  # Updated entry point
+            'myspeech_daemon=myspeech_daemon:main',
+            'myspeech_remote=myspeech_remote:main',
         ],
     },
 )
\ No newline at end of file